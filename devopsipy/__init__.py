@@ -3,12 +3,20 @@
 
 __author__ = 'sergey kharnam'
 
-# Imports
-from . import \
-    host_base, \
-    logger, \
-    exceptions, \
-    decorators, \
-    utils
-
-__all__ = [host_base, logger, exceptions, decorators, utils]
+# stdlib
+import importlib
+
+__all__ = ['host_base', 'logger', 'exceptions', 'decorators', 'utils', 'scheduler', 'aggregator', 'local_executor',
+           'callsite', 'text_replace', 'log_index', 'remote_executor', 'ssh_mux', 'fleet', 'stream_match',
+           'result_cache', 'tracing', 'cli']
+
+
+def __getattr__(name):
+    """
+    Import modules on first access, so e.g. the CLI or logger users don't pay for paramiko unless they need it
+    """
+    if name in __all__:
+        module = importlib.import_module('.' + name, __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,13 @@
+"""
+Module to run DevOpsiPy command line interface: python -m devopsipy (see cli.py)
+"""
+
+__author__ = 'sergey kharnam'
+
+# stdlib
+import sys
+
+# DevOpsiPy
+from devopsipy import cli
+
+sys.exit(cli.main())
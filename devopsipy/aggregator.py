@@ -0,0 +1,235 @@
+"""
+Module to contain output aggregation functionality (dshbak style)
+
+Identical outputs of the same command across hosts are stored once,
+together with the list of hosts which produced them.
+
+Usage:
+agg = OutputAggregator()
+for p_lst in scheduler.run('uname -r').values():
+    agg.add_all(p_lst)
+agg.print_groups()
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import re
+import hashlib
+
+
+class OutputVariant(object):
+    """
+    Class to represent a distinct output of a command and the hosts sharing it
+    """
+
+    def __init__(self, digest, cmd, rc, stdout, stderr):
+        self.digest = digest
+        self.cmd = cmd
+        self.rc = rc
+        self.stdout = stdout
+        self.stderr = stderr
+        self.hosts = list()
+
+    def __repr__(self):
+        return "<variant CMD: {0} RC: {1} HOSTS: {2}>".format(self.cmd, self.rc, len(self.hosts))
+
+    def __str__(self):
+        """
+        Returns dshbak style block: header with hosts and the shared output
+
+        :rtype: str
+        """
+        header = '{} ({})'.format(compress_hostnames(self.hosts), len(self.hosts))
+        sep = '-' * max(16, len(header))
+        data = [sep, header, sep, 'CMD: ' + self.cmd, 'RC: ' + str(self.rc)]
+        data.extend(_as_lines(self.stdout))
+        if self.stderr:
+            data.append('STDERR:')
+            data.extend(_as_lines(self.stderr))
+        return '\n'.join(data)
+
+
+class OutputAggregator(object):
+    """
+    Class to group identical command results across hosts
+
+    Every result is hashed as it is added (without joining line lists),
+    only the first copy of each distinct output is kept and duplicates are
+    collapsed into the hosts list of the matching variant.
+
+    :param include_rc: consider return code as part of the output
+    :param include_stderr: consider stderr as part of the output
+    """
+
+    def __init__(self, include_rc=True, include_stderr=True):
+        self._include_rc = include_rc
+        self._include_stderr = include_stderr
+        self._variants = dict()  # (cmd, digest) --> OutputVariant
+
+    def __len__(self):
+        return len(self._variants)
+
+    # -------------------------------
+    # Feeding
+
+    def add(self, p):
+        """
+        Add pstate to aggregation.
+        pstate stdout/stderr are replaced with the shared variant copies, so duplicates can be garbage collected
+
+        :param p: pstate object
+        :return: OutputVariant the pstate belongs to
+        """
+        h = hashlib.blake2b(digest_size=16)
+        _hash_output(h, p.stdout)
+        if self._include_stderr:
+            h.update(b'\x00')
+            _hash_output(h, p.stderr)
+        variant = self._add_variant(h, p.hostname, p.cmd, p.rc, p.stdout, p.stderr)
+        p.stdout = variant.stdout
+        p.stderr = variant.stderr
+        return variant
+
+    def add_all(self, p_lst):
+        """
+        Add list of pstate objects to aggregation
+
+        :param p_lst: list of pstate objects
+        """
+        for p in p_lst:
+            self.add(p)
+
+    # -------------------------------
+    # Reporting
+
+    def groups(self, cmd=None):
+        """
+        Return variants, the most common first
+
+        :param cmd: filter by command (default: all commands)
+        :return: list of OutputVariant objects
+        """
+        variants = [v for v in self._variants.values() if cmd is None or v.cmd == cmd]
+        return sorted(variants, key=lambda v: (v.cmd, -len(v.hosts)))
+
+    def report(self, cmd=None):
+        """
+        Return dshbak style report of all variants
+
+        :param cmd: filter by command (default: all commands)
+        :rtype: str
+        """
+        return '\n'.join(v.__str__() for v in self.groups(cmd=cmd))
+
+    def print_groups(self, cmd=None):
+        """
+        Log dshbak style report of all variants
+        """
+        log.info('AGGREGATED OUTPUT:\n{}'.format(self.report(cmd=cmd)))
+
+    def _add_variant(self, h, hostname, cmd, rc, stdout, stderr):
+        if self._include_rc:
+            h.update(b'\x00' + str(rc).encode())
+        key = (cmd, h.hexdigest())
+        variant = self._variants.get(key)
+        if variant is None:
+            log.debug('new output variant for command < {} > from host < {} >'.format(cmd, hostname))
+            variant = OutputVariant(key[1], cmd, rc, stdout, stderr)
+            self._variants[key] = variant
+        variant.hosts.append(hostname)
+        return variant
+
+
+# -------------------------------
+# Helpers
+
+def compress_hostnames(hosts):
+    """
+    Compress host names to pdsh style ranges, e.g. web1,web2,web3,db --> db,web[1-3]
+
+    :param hosts: list of host names
+    :rtype: str
+    """
+    pattern = re.compile(r'^(.*?)(\d+)$')
+    prefixes = dict()  # (prefix, digits width) --> list of numbers
+    result = list()
+    for host in sorted(set(hosts)):
+        m = pattern.match(host)
+        if m:
+            prefixes.setdefault((m.group(1), len(m.group(2))), list()).append(int(m.group(2)))
+        else:
+            result.append(host)
+
+    for (prefix, width), numbers in sorted(prefixes.items()):
+        numbers.sort()
+        if len(numbers) == 1:
+            result.append('{}{:0{}d}'.format(prefix, numbers[0], width))
+            continue
+        ranges = list()
+        start = prev = numbers[0]
+        for n in numbers[1:] + [None]:
+            if n is not None and n == prev + 1:
+                prev = n
+                continue
+            if start == prev:
+                ranges.append('{:0{}d}'.format(start, width))
+            else:
+                ranges.append('{:0{}d}-{:0{}d}'.format(start, width, prev, width))
+            start = prev = n
+        result.append('{}[{}]'.format(prefix, ','.join(ranges)))
+    return ','.join(sorted(result))
+
+
+def expand_hostnames(hosts):
+    """
+    Expand pdsh style host ranges, e.g. db,web[1-3,07] --> db,web1,web2,web3,web07 (inverse of compress_hostnames())
+
+    :param hosts: comma separated host names string or list of them
+    :return: list of host names, in given order without duplicates
+    """
+    if isinstance(hosts, str):
+        hosts = [hosts]
+    result = list()
+    for item in hosts:
+        # split by commas outside of brackets
+        for host in re.findall(r'(?:[^,\[]|\[[^\]]*\])+', item):
+            result.extend(_expand_range(host.strip()))
+    return list(dict.fromkeys(h for h in result if h))
+
+
+def _expand_range(host):
+    m = re.match(r'^(.*?)\[([^\]]+)\](.*)$', host)
+    if not m:
+        return [host]
+    prefix, ranges, suffix = m.groups()
+    hosts = list()
+    for part in ranges.split(','):
+        start, _, end = part.partition('-')
+        for n in range(int(start), int(end or start) + 1):
+            # expand the rest, it may contain more ranges
+            hosts.extend(_expand_range('{}{:0{}d}{}'.format(prefix, n, len(start), suffix)))
+    return hosts
+
+
+def _hash_output(h, output):
+    """
+    Hash output as a whole (remote runs) or line by line (local runs) without joining it.
+    Trailing newline of the whole output is not hashed, so local and remote runs of the same output match
+    """
+    if isinstance(output, str):
+        h.update((output[:-1] if output.endswith('\n') else output).encode(encoding='UTF-8'))
+        return
+    for i, line in enumerate(output):
+        if i:
+            h.update(b'\n')
+        h.update(line.encode(encoding='UTF-8'))
+
+
+def _as_lines(output):
+    if isinstance(output, str):
+        return output.splitlines()
+    return list(output)
@@ -0,0 +1,128 @@
+"""
+Module to contain lightweight call-site tracing
+
+Call-site (caller class, function, file and line) is captured from frame objects,
+without inspect.stack() (which reads source files for every frame on the stack).
+Static per-function data is cached per code object.
+
+Usage:
+site = callsite.get_callsite()           # the function calling get_callsite()
+site = callsite.get_external_callsite()  # the first frame outside DevOpsiPy, e.g. automation step calling run()
+"""
+
+__author__ = 'sergey kharnam'
+
+# stdlib
+import os
+import sys
+import logging
+from collections import namedtuple
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGGING_DIR = os.path.dirname(os.path.abspath(logging.__file__))
+SKIP_MODULES = ('retry', 'decorator', 'threading', 'concurrent.futures', 'selectors')
+
+_code_cache = dict()  # code --> (class name, function name, filename, is internal)
+
+
+class CallSite(namedtuple('CallSite', ['cls', 'func', 'filename', 'lineno'])):
+    """
+    Class to represent call-site: caller class (or None), function, file and line
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        func = '{}.{}'.format(self.cls, self.func) if self.cls else self.func
+        return '{}() {}:{}'.format(func, self.filename, self.lineno)
+
+
+def get_callsite(depth=0):
+    """
+    Return call-site of the function calling get_callsite()
+
+    :param depth: number of additional frames to go up
+    :return: CallSite or None if the stack is not deep enough
+    """
+    try:
+        frame = sys._getframe(depth + 1)
+    except ValueError:
+        return None
+    return _make_callsite(frame, _code_info(frame))
+
+
+def get_external_callsite(depth=0):
+    """
+    Return the first call-site outside DevOpsiPy, logging and decorator modules
+
+    :param depth: number of additional frames to skip before the search
+    :return: CallSite or None if there is no such frame
+    """
+    try:
+        frame = sys._getframe(depth + 1)
+    except ValueError:
+        return None
+    while frame is not None:
+        info = _code_info(frame)
+        if not info[3]:
+            return _make_callsite(frame, info)
+        frame = frame.f_back
+    return None
+
+
+class CallSiteFilter(logging.Filter):
+    """
+    Logging filter to add 'callsite' attribute (external call-site) to log records,
+    to be used in formatters as %(callsite)s
+    """
+
+    def filter(self, record):
+        record.callsite = str(get_external_callsite())
+        return True
+
+
+def _code_info(frame):
+    """
+    Return cached static info of frame code object
+
+    :return: (class name, function name, filename, is internal)
+    """
+    code = frame.f_code
+    info = _code_cache.get(code)
+    if info is None:
+        qualname = getattr(code, 'co_qualname', None)
+        if qualname is None:
+            cls, func = _class_from_locals(frame), code.co_name
+        else:
+            cls, _, func = qualname.rpartition('.')
+            cls = cls.rpartition('.')[2]
+            cls = None if not cls or cls == '<locals>' else cls
+        module = frame.f_globals.get('__name__', '')
+        internal = code.co_filename.startswith((PACKAGE_DIR, LOGGING_DIR)) or \
+            module == __name__ or _is_skipped_module(module)
+        info = (cls, func, code.co_filename, internal)
+        if qualname is not None:
+            _code_cache[code] = info
+    return info
+
+
+def _is_skipped_module(module):
+    """
+    Check module is one of SKIP_MODULES or their submodules (e.g. 'decorator' but not 'decorators_app')
+    """
+    return any(module == m or module.startswith(m + '.') for m in SKIP_MODULES)
+
+
+def _class_from_locals(frame):
+    """
+    Resolve caller class from 'self' or 'cls' local (Python < 3.11, no co_qualname)
+    """
+    code = frame.f_code
+    if code.co_argcount and code.co_varnames[0] in ('self', 'cls'):
+        obj = frame.f_locals.get(code.co_varnames[0])
+        if obj is not None:
+            return obj.__name__ if isinstance(obj, type) else type(obj).__name__
+    return None
+
+
+def _make_callsite(frame, info):
+    return CallSite(info[0], info[1], info[2], frame.f_lineno)
@@ -0,0 +1,306 @@
+"""
+Module to contain pdsh style command line interface
+
+Runs a command on many hosts in parallel and prints every output line prefixed by its host as it arrives,
+or (with -b) dshbak style groups of hosts with identical output once all hosts are done.
+DevOpsiPy modules are imported only when needed, so --help and argument errors return immediately
+and e.g. YAML or tracing are loaded only if used.
+
+Usage:
+python -m devopsipy -w web[1-4],db1 -l deploy -k ~/.ssh/id_rsa uptime
+python -m devopsipy -f hosts.txt -F 64 -t 30 systemctl is-active nginx
+python -m devopsipy -i inventory.yml -g web -b uname -r
+
+Inventory (YAML) maps groups to host lists, or to dicts with hosts and connection settings:
+web:
+  hosts: [web[1-4].example.com]
+  ssh_user: deploy
+  ssh_key_file: ~/.ssh/id_rsa
+db: [db1.example.com, db2.example.com]
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import sys
+import argparse
+import threading
+import functools
+
+# DevOpsiPy
+from . import cli_const as cc
+from . import fleet
+
+HOST_SETTINGS = ('ssh_user', 'ssh_pass', 'ssh_key_file')
+
+
+class LinePrinter(object):
+    """
+    Class to print output chunks of many hosts as complete lines prefixed by the hostname.
+    stdout lines go to stdout, stderr lines to stderr, lines of different hosts never interleave
+    """
+
+    def __init__(self):
+        self._pending = dict()  # (hostname, is_stderr) --> incomplete last line
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # worker processes start with empty buffers
+        return dict()
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def write(self, hostname, text, is_stderr=False):
+        """
+        Print complete lines of the output chunk, keep the incomplete last line
+
+        :param hostname: hostname
+        :param text: output chunk
+        :param is_stderr: chunk is from stderr
+        """
+        with self._lock:
+            lines = (self._pending.pop((hostname, is_stderr), '') + text).split('\n')
+            if lines[-1]:
+                self._pending[hostname, is_stderr] = lines[-1]
+            if len(lines) > 1:
+                self._print(hostname, lines[:-1], is_stderr)
+
+    def flush(self, hostname):
+        """
+        Print incomplete last lines of the host
+        """
+        with self._lock:
+            for is_stderr in (False, True):
+                line = self._pending.pop((hostname, is_stderr), None)
+                if line:
+                    self._print(hostname, [line], is_stderr)
+
+    @staticmethod
+    def _print(hostname, lines, is_stderr):
+        out = sys.stderr if is_stderr else sys.stdout
+        out.write(''.join('{}: {}\n'.format(hostname, line.rstrip('\r')) for line in lines))
+        out.flush()
+
+
+class CliHost(fleet.HostSpec):
+    """
+    Class to represent a host given on the command line, streaming its output to the printer.
+    HostBase (resolve, ping and SSH check) is initialized in the fan-out worker, not sequentially upfront
+
+    :param hostname: FQDN or IP
+    :param printer: LinePrinter streaming the output, None to not stream it
+    :param settings: HostBase connection settings (ssh_user, ssh_pass, ssh_key_file)
+    """
+
+    def __init__(self, hostname, printer=None, **settings):
+        super().__init__(hostname, **settings)
+        self._printer = printer
+
+    def iter_run(self, commands, **run_kwargs):
+        """
+        HostBase.iter_run() streaming the output to the printer
+
+        :return: generator of pstate objects
+        """
+        host = self.get_host()
+        if self._printer is not None:
+            run_kwargs['on_output'] = functools.partial(self._printer.write, self.hostname)
+        try:
+            for p in host.iter_run(commands, **run_kwargs):
+                yield p
+        finally:
+            if self._printer is not None:
+                self._printer.flush(self.hostname)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='devopsipy',
+        description='Run a command on many hosts in parallel (pdsh style)',
+        epilog='exit codes: 0 - all hosts succeeded, 1 - any host failed or was unreachable '
+               '(with -S the largest RC, 255 for unreachable hosts), 2 - usage error, 130 - interrupted. '
+               'SSH password is read from {} env var'.format(cc.SSH_PASS_ENV_VAR))
+    hosts = parser.add_argument_group('hosts')
+    hosts.add_argument('-w', dest='hosts', action='append', default=list(),
+                       help='comma separated hosts, pdsh style ranges: web[1-4],db1')
+    hosts.add_argument('-x', dest='exclude', action='append', default=list(), help='hosts to exclude')
+    hosts.add_argument('-f', '--hostfile', action='append', default=list(), help='file with a host per line')
+    hosts.add_argument('-i', '--inventory', default=os.environ.get(cc.INVENTORY_ENV_VAR),
+                       help='YAML inventory (default: {} env var)'.format(cc.INVENTORY_ENV_VAR))
+    hosts.add_argument('-g', '--group', dest='groups', action='append', default=list(),
+                       help='inventory group (default: all groups)')
+    parser.add_argument('-l', '--user', help='SSH user')
+    parser.add_argument('-k', '--key-file', help='SSH private key file')
+    parser.add_argument('-F', '--fanout', type=int, default=cc.DEFAULT_FANOUT,
+                        help='max hosts running concurrently (default: %(default)s)')
+    parser.add_argument('-P', '--processes', type=int, default=1,
+                        help='worker processes to shard the hosts over (default: %(default)s)')
+    parser.add_argument('-t', '--timeout', type=float, default=0, help='command timeout in seconds')
+    parser.add_argument('-c', '--connect-timeout', type=float, default=0, help='SSH connect timeout in seconds')
+    parser.add_argument('-b', '--aggregate', action='store_true',
+                        help='print hosts grouped by identical output once all are done (dshbak style)')
+    parser.add_argument('-S', '--max-rc', action='store_true', help='exit with the largest RC of all hosts')
+    parser.add_argument('--trace', metavar='FILE', help='export execution timeline in Chrome trace format')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='log level: -v warning, -vv info, -vvv debug')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='command to run')
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.error('command is required')
+    if not (args.hosts or args.hostfile or args.inventory):
+        parser.error('no hosts given (-w, -f or -i)')
+    return args
+
+
+def load_hosts(args):
+    """
+    Collect hosts from -w, -f and the inventory, without duplicates and excluded hosts
+
+    :param args: parsed arguments
+    :return: list of (hostname, settings dict)
+    """
+    from . import aggregator
+    defaults = dict(ssh_user=args.user, ssh_pass=os.environ.get(cc.SSH_PASS_ENV_VAR),
+                    ssh_key_file=os.path.expanduser(args.key_file) if args.key_file else None)
+    overrides = {key: value for key, value in defaults.items() if value is not None}
+    hosts = list()
+    if args.inventory:
+        hosts.extend(load_inventory(args.inventory, groups=args.groups))
+    for path in args.hostfile:
+        hosts.extend((host, dict()) for host in load_hostfile(path))
+    hosts.extend((host, dict()) for host in aggregator.expand_hostnames(args.hosts))
+
+    exclude = set(aggregator.expand_hostnames(args.exclude))
+    result = dict()
+    for host, settings in hosts:
+        if host not in exclude and host not in result:
+            result[host] = dict(defaults, **dict(settings, **overrides))
+    return list(result.items())
+
+
+def load_inventory(path, groups=None):
+    """
+    Read hosts of inventory groups
+
+    :param path: YAML inventory path
+    :param groups: group names (default: all groups)
+    :return: list of (hostname, settings dict)
+    """
+    import yaml
+    from . import aggregator
+    with open(path) as f:
+        inventory = yaml.safe_load(f) or dict()
+    if not isinstance(inventory, dict):
+        raise ValueError('Inventory < {} > has to map groups to hosts'.format(path))
+    hosts = list()
+    for name in groups or inventory:
+        if name not in inventory:
+            raise ValueError('Group < {} > not found in inventory < {} >'.format(name, path))
+        group = inventory[name] or list()
+        settings = dict()
+        if isinstance(group, dict):
+            settings = {key: group[key] for key in HOST_SETTINGS if key in group}
+            if settings.get('ssh_key_file'):
+                settings['ssh_key_file'] = os.path.expanduser(settings['ssh_key_file'])
+            group = group.get('hosts') or list()
+        if isinstance(group, str):
+            group = [group]
+        hosts.extend((host, settings) for host in aggregator.expand_hostnames([str(h) for h in group]))
+    return hosts
+
+
+def load_hostfile(path):
+    """
+    Read hosts file: a host (or pdsh style range) per line, # comments
+
+    :return: list of hostnames
+    """
+    from . import aggregator
+    with open(path) as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return aggregator.expand_hostnames([line for line in lines if line])
+
+
+def exit_code(rcs, max_rc=False):
+    """
+    :param rcs: dict of hostname --> RC
+    :param max_rc: return the largest RC instead of RC_FAILED
+    :return: exit code
+    """
+    failed = [rc for rc in rcs.values() if rc != 0]
+    if not failed:
+        return cc.RC_OK
+    if not max_rc:
+        return cc.RC_FAILED
+    return max(cc.RC_UNREACHABLE if rc is None or rc < 0 else rc for rc in failed)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = (logging.CRITICAL + 1, logging.WARNING, logging.INFO, logging.DEBUG)
+    logging.basicConfig(level=levels[min(args.verbose, 3)], format='%(levelname)s %(name)s: %(message)s')
+    try:
+        hosts = load_hosts(args)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('devopsipy: {}\n'.format(e))
+        return cc.RC_USAGE
+    if not hosts:
+        sys.stderr.write('devopsipy: no hosts left to run on\n')
+        return cc.RC_USAGE
+
+    tracer = None
+    if args.trace:
+        from . import tracing
+        tracer = tracing.enable()
+    from . import host_base  # noqa: F401 -- before the fan-out, not concurrently in every worker
+    agg = None
+    if args.aggregate:
+        from . import aggregator
+        agg = aggregator.OutputAggregator()
+    printer = None if agg is not None else LinePrinter()
+    command = ' '.join(args.command)
+    cli_hosts = [CliHost(host, printer, **settings) for host, settings in hosts]
+    run_kwargs = dict(max_workers=args.fanout, timeout=args.timeout, ssh_timeout=args.connect_timeout)
+    if args.processes > 1:
+        stream = fleet.iter_sharded(cli_hosts, command, processes=args.processes, **run_kwargs)
+    else:
+        stream = fleet.iter_fleet(cli_hosts, command, **run_kwargs)
+
+    rcs = dict()
+    try:
+        for p in stream:
+            rcs[p.hostname] = p.rc
+            if agg is not None:
+                agg.add(p)
+            elif p.timed_out:
+                sys.stderr.write('devopsipy: {}: timed out after {} sec\n'.format(p.hostname, args.timeout))
+            elif p.rc == -1:
+                reason = p.stderr if isinstance(p.stderr, str) else '; '.join(p.stderr)
+                sys.stderr.write('devopsipy: {}: failed: {}\n'.format(p.hostname, reason.strip()))
+            elif p.rc:
+                sys.stderr.write('devopsipy: {}: exited with RC {}\n'.format(p.hostname, p.rc))
+    except KeyboardInterrupt:
+        sys.stderr.write('devopsipy: interrupted\n')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # running commands can't be interrupted in worker threads, don't wait for them
+        os._exit(cc.RC_INTERRUPTED)
+    finally:
+        stream.close()
+
+    if agg is not None:
+        report = agg.report()
+        if report:
+            print(report)
+    if tracer:
+        tracer.export(args.trace)
+    return exit_code(rcs, max_rc=args.max_rc)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
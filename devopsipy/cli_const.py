@@ -0,0 +1,14 @@
+"""
+Module to contain command line interface related constants
+"""
+
+DEFAULT_FANOUT = 32  # hosts running concurrently, same as pdsh
+SSH_PASS_ENV_VAR = 'DEVOPSIPY_SSH_PASS'
+INVENTORY_ENV_VAR = 'DEVOPSIPY_INVENTORY'
+
+# exit codes
+RC_OK = 0
+RC_FAILED = 1  # any host failed or was unreachable
+RC_USAGE = 2  # same as argparse
+RC_UNREACHABLE = 255  # with --max-rc, same as ssh(1)
+RC_INTERRUPTED = 130
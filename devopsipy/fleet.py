@@ -0,0 +1,324 @@
+"""
+Module to contain streaming execution over a set of hosts
+
+Every pstate is delivered as soon as its command completes on its host, in completion order,
+as a generator, an async iterator or to a callback. Stopping the consumer cancels the rest of the work:
+hosts not started yet are skipped and running hosts stop after their current command.
+
+Usage:
+for p in iter_fleet(hosts, ['systemctl restart my_service', 'systemctl is-active my_service']):
+    if p.rc:
+        break  # fail fast, the rest is cancelled
+
+async for p in aiter_fleet(hosts, 'uptime'):
+    await notify(p)
+
+results = run_fleet(hosts, 'uname -r', on_result=aggregator.add)
+
+hosts = [HostSpec(h, ssh_user='user', ssh_key_file='~/.ssh/id_rsa') for h in host_names]
+results = run_sharded(hosts, 'uname -r', processes=8)  # thousands of hosts, SSH work spread over 8 processes
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import queue
+import asyncio
+import threading
+import time
+import multiprocessing
+from concurrent import futures
+
+# DevOpsiPy
+from . import pstate
+from . import callsite
+from . import tracing
+from . import host_base_const as hbc
+
+_HOST_DONE = object()
+
+
+class HostSpec(object):
+    """
+    Class to represent a host by its hostname and HostBase settings.
+    HostBase (resolve, ping and SSH check) is initialized by iter_run() in the thread and process executing it,
+    so it runs concurrently in the fan-out (and in the worker processes of iter_sharded()), not sequentially upfront
+
+    :param hostname: FQDN or IP
+    :param settings: HostBase keyword arguments (ssh_user, ssh_pass, ssh_key_file...)
+    """
+
+    def __init__(self, hostname, **settings):
+        self.hostname = hostname
+        self._settings = settings
+        self._tracer = None
+
+    def __str__(self):
+        return self.hostname
+
+    def __getstate__(self):
+        """
+        Pickle support (passing hosts to worker processes), the tracer is process local
+        """
+        state = self.__dict__.copy()
+        state['_tracer'] = None
+        return state
+
+    def set_tracer(self, tracer):
+        """
+        Set tracer of the host, None - global tracing.get_tracer()
+        """
+        self._tracer = tracer
+
+    def get_host(self):
+        """
+        :return: new HostBase object of the host
+        """
+        from . import host_base
+        return host_base.HostBase(self.hostname, tracer=self._tracer, **self._settings)
+
+    def iter_run(self, commands, **run_kwargs):
+        """
+        Initialize HostBase and execute commands (see HostBase.iter_run())
+
+        :return: generator of pstate objects
+        """
+        return self.get_host().iter_run(commands, **run_kwargs)
+
+
+def iter_fleet(hosts, commands, max_workers=0, cancel=None, **run_kwargs):
+    """
+    Execute commands on hosts concurrently, yielding every pstate as soon as its command completes.
+    A host failing with an exception yields a single pstate with rc -1 and the error in stderr.
+    Closing the generator (break out of the loop, generator.close()) or setting cancel stops the rest
+
+    :param hosts: list of HostBase objects
+    :param commands: command or list of commands, executed in order on every host
+    :param max_workers: max hosts running concurrently (default: all hosts)
+    :param cancel: optional threading.Event to cancel execution from another thread
+    :param run_kwargs: HostBase.iter_run() keyword arguments (timeout, ssh_timeout, parallel...)
+    :return: generator of pstate objects, in completion order
+    """
+    hosts = list(hosts)
+    if not hosts:
+        return
+    cancel = cancel or threading.Event()
+    results = queue.Queue()
+    log.debug('streaming execution on < {} > hosts'.format(len(hosts)))
+    executor = futures.ThreadPoolExecutor(max_workers=min(max_workers or len(hosts), len(hosts)))
+    pending = len(hosts)
+    try:
+        for host in hosts:
+            executor.submit(_run_host, host, commands, run_kwargs, results, cancel)
+        while pending:
+            item = results.get()
+            if item is _HOST_DONE:
+                pending -= 1
+            else:
+                yield item
+    finally:
+        if pending:
+            log.info('cancelling execution on < {} > hosts'.format(pending))
+            cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_fleet(hosts, commands, max_workers=0, **run_kwargs):
+    """
+    Async iterator version of iter_fleet(), execution runs in threads and does not block the event loop.
+    Leaving the loop or cancelling the task cancels the rest
+
+    :param hosts: list of HostBase objects
+    :param commands: command or list of commands, executed in order on every host
+    :param max_workers: max hosts running concurrently (default: all hosts)
+    :param run_kwargs: HostBase.iter_run() keyword arguments
+    :return: async generator of pstate objects, in completion order
+    """
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+    results = iter_fleet(hosts, commands, max_workers=max_workers, cancel=cancel, **run_kwargs)
+    try:
+        while True:
+            p = await loop.run_in_executor(None, next, results, _HOST_DONE)
+            if p is _HOST_DONE:
+                break
+            yield p
+    finally:
+        cancel.set()
+        try:
+            results.close()
+        except ValueError:
+            # still running in the executor thread (task cancelled while waiting), it exits on its own
+            pass
+
+
+def run_fleet(hosts, commands, on_result=None, max_workers=0, cancel=None, **run_kwargs):
+    """
+    Execute commands on hosts concurrently, passing every pstate to on_result as soon as it completes
+
+    :param hosts: list of HostBase objects
+    :param commands: command or list of commands, executed in order on every host
+    :param on_result: callable(pstate), returning False cancels the rest
+    :param max_workers: max hosts running concurrently (default: all hosts)
+    :param cancel: optional threading.Event to cancel execution from another thread
+    :param run_kwargs: HostBase.iter_run() keyword arguments
+    :return: dict of hostname --> list of pstate objects received
+    """
+    results = {str(host): list() for host in hosts}
+    stream = iter_fleet(hosts, commands, max_workers=max_workers, cancel=cancel, **run_kwargs)
+    try:
+        for p in stream:
+            results[p.hostname].append(p)
+            if on_result is not None and on_result(p) is False:
+                log.info('execution cancelled by result of < {} > on host < {} >'.format(p.cmd, p.hostname))
+                break
+    finally:
+        stream.close()
+    return results
+
+
+def iter_sharded(hosts, commands, processes=0, max_workers=0, **run_kwargs):
+    """
+    Execute commands on hosts split into shards over worker processes, so SSH key exchange, encryption
+    and output decoding (pure Python in paramiko) scale with CPU cores instead of being bound by the GIL.
+    Every worker owns SSH connections of its shard and streams compact pstate tuples back as they complete.
+    Closing the generator cancels the rest, as in iter_fleet().
+    If tracing is enabled, workers trace their shards and their events are added to the global tracer
+
+    :param hosts: list of HostSpec objects or hostnames, initialized in the worker processes.
+                  HostBase objects work too (their result caches are not passed),
+                  but they were already initialized one by one in this process
+    :param commands: command or list of commands, executed in order on every host
+    :param processes: number of worker processes (default: CPU count)
+    :param max_workers: max hosts running concurrently in every worker process (default: all shard hosts)
+    :param run_kwargs: HostBase.iter_run() keyword arguments
+    :return: generator of pstate objects, in completion order
+    """
+    hosts = [HostSpec(host) if isinstance(host, str) else host for host in hosts]
+    if not hosts:
+        return
+    caller = callsite.get_external_callsite()
+    tracer = tracing.get_tracer()
+    processes = min(processes or os.cpu_count() or 1, len(hosts))
+    shards = [hosts[i::processes] for i in range(processes)]
+    ctx = multiprocessing.get_context()
+    results = ctx.Queue()
+    cancel = ctx.Event()
+    workers = [ctx.Process(target=_run_shard, name='fleet-shard-{}'.format(i), daemon=True,
+                           args=(i, shard, commands, max_workers, run_kwargs, results, cancel, tracer.enabled))
+               for i, shard in enumerate(shards)]
+    log.debug('streaming execution on < {} > hosts in < {} > processes'.format(len(hosts), processes))
+    for worker in workers:
+        worker.start()
+    pending = set(range(processes))
+    reported = set()
+    try:
+        while pending:
+            try:
+                shard, kind, values = results.get(timeout=hbc.SHARD_POLL_INTERVAL)
+            except queue.Empty:
+                # a worker died without reporting (killed, crashed interpreter)
+                for i in [i for i in pending if workers[i].exitcode is not None]:
+                    log.error('Worker process < {} > exited with < {} >'.format(workers[i].name, workers[i].exitcode))
+                    pending.discard(i)
+                    for host in shards[i]:
+                        if str(host) not in reported:
+                            yield pstate.failed_pstate(host, commands, 'worker process exited unexpectedly')
+                continue
+            if kind == 'done':
+                pending.discard(shard)
+                continue
+            if kind == 'trace':
+                tracer.add_events(values)
+                continue
+            p = pstate.Pstate.from_tuple(values)
+            p.caller = caller
+            reported.add(p.hostname)
+            yield p
+    finally:
+        if pending:
+            log.info('cancelling execution in < {} > worker processes'.format(len(pending)))
+        cancel.set()
+        deadline = time.time() + hbc.KILL_GRACE_PERIOD
+        for worker in workers:
+            # keep draining, a worker can't exit before its queued results are consumed
+            while worker.is_alive() and time.time() < deadline:
+                try:
+                    results.get(timeout=hbc.SHARD_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        results.close()
+
+
+def run_sharded(hosts, commands, processes=0, max_workers=0, on_result=None, **run_kwargs):
+    """
+    Execute commands on hosts over worker processes (see iter_sharded())
+
+    :param hosts: list of HostSpec objects or hostnames (see iter_sharded())
+    :param commands: command or list of commands, executed in order on every host
+    :param processes: number of worker processes (default: CPU count)
+    :param max_workers: max hosts running concurrently in every worker process (default: all shard hosts)
+    :param on_result: optional callable(pstate) called as results arrive, returning False cancels the rest
+    :param run_kwargs: HostBase.iter_run() keyword arguments
+    :return: dict of hostname --> list of pstate objects, in commands order (as HostBase.run() returns)
+    """
+    results = {str(host): list() for host in hosts}
+    stream = iter_sharded(hosts, commands, processes=processes, max_workers=max_workers, **run_kwargs)
+    try:
+        for p in stream:
+            results[p.hostname].append(p)
+            if on_result is not None and on_result(p) is False:
+                log.info('execution cancelled by result of < {} > on host < {} >'.format(p.cmd, p.hostname))
+                break
+    finally:
+        # every host executes its commands in order, so its results arrive in commands order
+        stream.close()
+    return results
+
+
+def _run_shard(shard, hosts, commands, max_workers, run_kwargs, results, cancel, trace=False):
+    """
+    Worker process: stream results of the shard hosts to the results queue as (shard, 'pstate', pstate tuple),
+    then (shard, 'trace', events) if tracing and (shard, 'done', None)
+    """
+    tracer = tracing.enable() if trace else tracing.NULL_TRACER
+    if trace:
+        for host in hosts:
+            # forked copies of hosts keep tracers of the parent process
+            host.set_tracer(None)
+    try:
+        for p in iter_fleet(hosts, commands, max_workers=max_workers, cancel=cancel, **run_kwargs):
+            results.put((shard, 'pstate', p.to_tuple()))
+    finally:
+        if len(tracer):
+            results.put((shard, 'trace', tracer.events()))
+        results.put((shard, 'done', None))
+
+
+def _run_host(host, commands, run_kwargs, results, cancel):
+    """
+    Stream results of a single host to the results queue until done or cancelled
+    """
+    try:
+        if cancel.is_set():
+            return
+        stream = host.iter_run(commands, **run_kwargs)
+        try:
+            for p in stream:
+                results.put(p)
+                if cancel.is_set():
+                    break
+        finally:
+            stream.close()
+    except Exception as e:
+        log.error('Execution on host < {} > failed: {}'.format(host, e))
+        results.put(pstate.failed_pstate(host, commands, str(e)))
+    finally:
+        results.put(_HOST_DONE)
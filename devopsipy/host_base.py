@@ -3,7 +3,6 @@ Module to contain Base Host functionality
 """
 import calendar
 import re
-import sys
 
 __author__ = 'sergey kharnam'
 
@@ -15,18 +14,22 @@ import time
 import os
 import socket
 import platform
-import subprocess
 import ipaddress
-from pathlib import Path
 
 # PyPi
 from retry import retry
-import paramiko as pm
 
 # DevOpsiPy
-import pstate
-import exceptions as pe
-import host_base_const as hbc
+from . import pstate
+from . import exceptions as pe
+from . import host_base_const as hbc
+from . import local_executor as le
+from . import callsite
+from . import remote_executor as rx
+from . import ssh_mux
+from . import stream_match
+from . import result_cache as rcache
+from . import tracing
 
 
 class HostBase(object):
@@ -38,13 +41,21 @@ class HostBase(object):
     :param ssh_user: ssh user
     :param ssh_pass: ssh password
     :param ssh_key_file: ssh private key file path
+    :param ssh_mux_socket: SSH mux daemon socket path (default: DEVOPSIPY_SSH_MUX env var),
+                           remote commands are executed through the daemon session if it's running
+    :param result_cache: ResultCache used by run(..., cache=True) (default: shared result_cache.get_default_cache())
+    :param tracer: tracing.Tracer recording resolve, ping, connect, open, exec, read and close spans
+                   (default: global tracing.get_tracer(), records nothing unless tracing is enabled)
     """
 
     def __init__(self,
                  hostname='localhost',
                  ssh_user=None,
                  ssh_pass=None,
-                 ssh_key_file=None):
+                 ssh_key_file=None,
+                 ssh_mux_socket=None,
+                 result_cache=None,
+                 tracer=None):
 
         # -------------------------------
         # Host State
@@ -56,6 +67,9 @@ class HostBase(object):
         self._ssh_pass = ssh_pass
         self._ssh_user = ssh_user
         self._ssh_key_file = ssh_key_file
+        self._ssh_mux_socket = ssh_mux_socket or os.environ.get(hbc.SSH_MUX_ENV_VAR)
+        self._result_cache = result_cache
+        self._tracer = tracer
         self._os_type = None
         self._os_version = None
         self._is_pingable = None
@@ -86,6 +100,17 @@ class HostBase(object):
             d[m] = eval('self.{}'.format(m))
         return d
 
+    def __getstate__(self):
+        """
+        Pickle support (e.g. passing hosts to worker processes), the result cache and tracer are process local
+
+        :returns: dict
+        """
+        state = self.__dict__.copy()
+        state['_result_cache'] = None
+        state['_tracer'] = None
+        return state
+
     def host_base_init(self, hostname):
         """
         Initialize Host state
@@ -93,13 +118,16 @@ class HostBase(object):
         :param hostname: hostname before resolution
         """
         log.info('Start host < {} > initialization...'.format(hostname))
-        self.resolve_hostname(hostname=hostname)
+        tracer = self.__get_tracer()
+        with tracer.span('resolve', host=hostname):
+            self.resolve_hostname(hostname=hostname)
         if self._is_localhost:
             self._os_type = platform.system()
             self._os_version = platform.version()
 
         else:
-            self.is_pingable()
+            with tracer.span('ping', host=self._hostname):
+                self.is_pingable()
             self.is_reachable()
 
     @staticmethod
@@ -195,14 +223,17 @@ class HostBase(object):
     # Host Actions
 
     # TODO: Concurrency with AsyncIO
-    @retry(Exception, tries=2, delay=2)
     def run(self, commands,
             blocking=True,
             timeout=0,
             ssh_timeout=0,
             verify_rc=False,
             print_stdout=False,
-            print_pstate=False):
+            print_pstate=False,
+            parallel=1,
+            cache=False,
+            on_output=None,
+            get_pty=False):
         """
         Execute shell command:
         - remote host -- over SSH
@@ -210,118 +241,282 @@ class HostBase(object):
 
         :param commands:
         :param blocking:
-        :param timeout:
-        :param ssh_timeout:
-        :param verify_rc:
-        :param pid:
+        :param timeout: per command deadline in seconds (0 - no limit).
+                        timed out command gets RC hbc.RC_TIMEOUT. localhost command is killed with its process tree,
+                        remote command is interrupted with get_pty, its channel is closed OW
+                        (the command gets SIGPIPE on its next write, but may keep running)
+        :param ssh_timeout: SSH connect timeout in seconds (0 - hbc.SSH_CONNECT_TIMEOUT)
+        :param verify_rc: raise HostCommandExecutionError on the first command with non-zero RC
         :param print_stdout:
         :param print_pstate:
+        :param parallel: max commands executed concurrently (localhost only, commands must be independent)
+        :param cache: serve read-only commands (uname -r, nproc...) from the result cache within its TTL,
+                      cached results are copies with pstate.cached set
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives,
+                          returning True stops the command (its RC is None then)
+        :param get_pty: run remote commands with a PTY, so timed out or stopped commands are interrupted and get
+                        SIGHUP. stderr is merged into stdout then and line endings become \\r\\n
         :return: list of pstate objects (to support multiple commands in one session)
         """
 
-        p_lst = list()
         if isinstance(commands, str):
             commands = [commands]
-        if not self._is_localhost:
-            client = self.__get_ssh_client(timeout=ssh_timeout)
-            for cmd in commands:
-                p = pstate.Pstate(hostname=self._hostname)
-                p.ipaddr = self._ipaddr
-                log.debug('executing command --> {}'.format(cmd))
-                p.epoch = calendar.timegm(time.gmtime())
-                start = time.time()
-                stdin, stdout, stderr = client.exec_command(cmd)
-                p.runtime = time.time() - start
-                p.cmd = cmd
-                p.stdout = stdout.read().decode(encoding='UTF-8')
-                p.stderr = stderr.read().decode(encoding='UTF-8')
-                p.rc = stdout.channel.recv_exit_status()
+        if self._is_localhost and not blocking:
+            # This should allow background (non blocking) execution !!!
+            # It's the caller's responsibility to call process.wait()
+            log.debug('executing command in background --> {}'.format(commands[0]))
+            return le.popen(commands[0], timeout=timeout)
 
+        p_lst = list()
+        tracer = self.__get_tracer()
+        results = self.__iter_run(commands, timeout=timeout, ssh_timeout=ssh_timeout, print_stdout=print_stdout,
+                                  parallel=parallel, cache=cache, on_output=on_output, get_pty=get_pty)
+        order = list()
+        try:
+            for i, p in results:
+                order.append(i)
                 p_lst.append(p)
                 if print_pstate:
-                    log.info('PSTATE:\n{}'.format(p.__str__()))
+                    with tracer.span('log', cat='command', host=self._hostname, cmd=p.cmd):
+                        log.info('PSTATE:\n{}'.format(p.__str__()))
+                if verify_rc and p.rc:
+                    self.__raise_rc_error(p)
+        finally:
+            # cancels commands not started yet
+            results.close()
+        if parallel > 1:
+            # restore commands order
+            p_lst = [p for _, p in sorted(zip(order, p_lst), key=lambda item: item[0])]
+        return p_lst
+
+    def iter_run(self, commands, timeout=0, ssh_timeout=0, print_stdout=False, parallel=1, cache=False,
+                 on_output=None, get_pty=False):
+        """
+        Execute shell commands like run(), yielding every pstate as soon as its command completes,
+        so the caller can react (fail fast, alert, aggregate) while the rest is still running.
+        Closing the generator (break out of the loop, generator.close()) cancels the commands not started yet
+
+        :param commands: command or list of commands
+        :param timeout: per command deadline in seconds (0 - no limit)
+        :param ssh_timeout: SSH connect timeout in seconds (0 - hbc.SSH_CONNECT_TIMEOUT)
+        :param print_stdout: stream output to stdout as it arrives
+        :param parallel: max commands executed concurrently (localhost only, commands must be independent)
+        :param cache: serve read-only commands from the result cache, successful results are cached
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives,
+                          returning True stops the command (its RC is None then)
+        :param get_pty: run remote commands with a PTY (see run())
+        :return: generator of pstate objects, in completion order
+        """
+        results = self.__iter_run(commands, timeout=timeout, ssh_timeout=ssh_timeout, print_stdout=print_stdout,
+                                  parallel=parallel, cache=cache, on_output=on_output, get_pty=get_pty)
+        try:
+            for _, p in results:
+                yield p
+        finally:
+            results.close()
 
-            client.close()
+    def __iter_run(self, commands, timeout=0, ssh_timeout=0, print_stdout=False, parallel=1, cache=False,
+                   on_output=None, get_pty=False):
+        """
+        iter_run() yielding (command index, pstate) tuples
+        """
+        if isinstance(commands, str):
+            commands = [commands]
+        caller = callsite.get_external_callsite()
+        tracer = self.__get_tracer()
+        result_cache = self.__get_result_cache() if cache else None
+        if not self._is_localhost:
+            mux = client = None
+            try:
+                for i, cmd in enumerate(commands):
+                    p = result_cache.get(self._hostname, cmd, user=self._ssh_user) if result_cache is not None else None
+                    if p:
+                        p.caller = caller
+                        yield i, p
+                        continue
+                    if not (mux or client):
+                        # commands go through the shared SSH mux daemon session if it's running
+                        with tracer.span('connect', host=self._hostname):
+                            mux = self.__get_mux_client(timeout=ssh_timeout)
+                            client = None if mux else self.__get_ssh_client(timeout=ssh_timeout)
+                    p = pstate.Pstate(hostname=self._hostname)
+                    p.ipaddr = self._ipaddr
+                    p.caller = caller
+                    log.debug('executing command --> {}'.format(cmd))
+                    p.epoch = calendar.timegm(time.gmtime())
+                    p.cmd = cmd
+                    if mux:
+                        with tracer.span('exec', cat='command', host=self._hostname, cmd=cmd) as span:
+                            mux.execute(p, timeout=timeout, print_stdout=print_stdout, on_output=on_output,
+                                        get_pty=get_pty)
+                            span.args['rc'] = p.rc
+                    else:
+                        rx.execute(client, p, timeout=timeout, print_stdout=print_stdout, tracer=tracer,
+                                   on_output=on_output, get_pty=get_pty)
+                    if result_cache is not None:
+                        result_cache.put(p, user=self._ssh_user)
+                    yield i, p
+            finally:
+                if client is not None:
+                    with tracer.span('close', host=self._hostname):
+                        client.close()
+        elif parallel > 1:
+            pending = list(range(len(commands)))  # indexes of commands to execute
+            if result_cache is not None:
+                pending = list()
+                for i, cmd in enumerate(commands):
+                    p = result_cache.get(self._hostname, cmd, user=self._ssh_user)
+                    if p:
+                        p.caller = caller
+                        yield i, p
+                    else:
+                        pending.append(i)
+            executor = le.LocalExecutor(max_workers=parallel, hostname=self._hostname, ipaddr=self._ipaddr,
+                                        tracer=tracer)
+            results = executor.iter_run([commands[i] for i in pending], timeout=timeout, print_stdout=print_stdout,
+                                        on_output=on_output, indexed=True)
+            try:
+                for j, p in results:
+                    p.caller = caller
+                    if result_cache is not None:
+                        result_cache.put(p, user=self._ssh_user)
+                    yield pending[j], p
+            finally:
+                results.close()
         else:
-            for cmd in commands:
-                p = pstate.Pstate(hostname=self._hostname)
-                p.ipaddr = self._ipaddr
-                log.debug('executing command --> {}'.format(cmd))
-                p.epoch = calendar.timegm(time.gmtime())
-                start = time.time()
-                prc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p.pid = prc.pid
-                p.cmd = cmd
-                # This should allow background (non blocking) execution !!!
-                # It's the caller's responsibility to call process.wait()
-                if not blocking:
-                    return prc
-
-                if prc.stdout:
-                    while True:
-                        line = prc.stdout.readline().decode(encoding='UTF-8')
-                        # print line to screen
-                        if print_stdout:
-                            sys.stdout.write(line)
-                            sys.stdout.flush()
-                        if not line:
-                            break
-                        p.stdout.append(line.rstrip())
-
-                if prc.stderr:
-                    while True:
-                        line = prc.stderr.readline().decode(encoding='UTF-8')
-                        # print line to screen
-                        if print_stdout:
-                            sys.stdout.write(line)
-                            sys.stdout.flush()
-                        if not line:
-                            break
-                        p.stderr.append(line.rstrip())
-                prc.wait()
-                p.rc = prc.returncode
-                p.runtime = time.time() - start
+            for i, cmd in enumerate(commands):
+                p = result_cache.get(self._hostname, cmd, user=self._ssh_user) if result_cache is not None else None
+                if not p:
+                    p = pstate.Pstate(hostname=self._hostname)
+                    p.ipaddr = self._ipaddr
+                    p.cmd = cmd
+                    le.execute(p, timeout=timeout, print_stdout=print_stdout, tracer=tracer, on_output=on_output)
+                    if result_cache is not None:
+                        result_cache.put(p, user=self._ssh_user)
+                p.caller = caller
+                yield i, p
+
+    def set_tracer(self, tracer):
+        """
+        Set tracer of the host
 
-                p_lst.append(p)
-                if print_pstate:
-                    log.info('PSTATE:\n{}'.format(p.__str__()))
+        :param tracer: tracing.Tracer, None to use the global tracer
+        """
+        self._tracer = tracer
 
-        return p_lst
+    def invalidate_cache(self, commands=None):
+        """
+        Drop cached results of the host
 
-    def __get_ssh_client(self, timeout=10):
+        :param commands: command or list of commands (default: all commands)
         """
-        Return paramiko.SSHClient object after establishing authentication
+        if isinstance(commands, str):
+            commands = [commands]
+        result_cache = self.__get_result_cache()
+        for cmd in commands or [None]:
+            result_cache.invalidate(hostname=self._hostname, cmd=cmd, user=self._ssh_user)
+
+    def wait_for(self, command, patterns, timeout=0, ssh_timeout=0, flags=0):
+        """
+        Follow command output (e.g. 'tail -F /var/log/app.log' or the service itself) until a line matches
+        one of the patterns, then stop the command. Uses a single SSH channel, the output is matched
+        incrementally as it arrives
+
+        :param command: command string
+        :param patterns: regex string, compiled pattern or list of them (matched line by line)
+        :param timeout: seconds to wait for a match (0 - no limit)
+        :param ssh_timeout: SSH connect timeout in seconds (0 - hbc.SSH_CONNECT_TIMEOUT)
+        :param flags: re flags for regex strings
+        :return: re.Match of the first matching line (match.re is the matched pattern),
+                 None if the command exited or timed out without a match
+        """
+        matcher = stream_match.StreamMatcher(patterns, flags=flags)
+
+        def on_output(text, is_stderr):
+            return matcher.feed(text, stream=int(is_stderr)) is not None
+
+        log.debug('waiting for < {} > in output of command --> {}'
+                  .format(', '.join(p.pattern for p in matcher.patterns), command))
+        if not self._is_localhost:
+            mux = self.__get_mux_client(timeout=ssh_timeout)
+            if mux:
+                rc = mux.exec_command(command, timeout=timeout, on_output=on_output, get_pty=True)[2]
+            else:
+                client = self.__get_ssh_client(timeout=ssh_timeout)
+                try:
+                    rc = rx.exec_command(client.get_transport(), command, timeout=timeout, on_output=on_output,
+                                         get_pty=True, tracer=self.__get_tracer(), host=self._hostname)[2]
+                finally:
+                    client.close()
+        else:
+            rc = le.follow(command, timeout=timeout, on_output=on_output)[2]
+
+        if matcher.match is None and matcher.flush() is None:
+            log.warning('No match in output of command < {} > on host < {} > (RC < {} >)'
+                        .format(command, self._hostname, rc))
+        return matcher.match
+
+    def __raise_rc_error(self, p):
+        """
+        Raise HostCommandExecutionError for pstate with non-zero return code
+
+        :param p: pstate of the failed command
+        """
+        log.error('Command < {} > on host < {} > failed with RC < {} >'.format(p.cmd, self._hostname, p.rc))
+        raise pe.HostCommandExecutionError('Command < {} > failed on host < {} >'.format(p.cmd, self._hostname),
+                                           errors=p)
+
+    @retry(pe.HostConnectivityError, tries=2, delay=2)
+    def __get_ssh_client(self, timeout=0):
+        """
+        Return paramiko.SSHClient object after establishing authentication.
+        Only the connection setup is retried, commands are never re-executed
+
+        :param timeout: connect, banner and auth timeout in seconds (0 - hbc.SSH_CONNECT_TIMEOUT)
         :return: paramiko.SSHClient
         """
+        try:
+            return rx.connect(self._hostname,
+                              ssh_user=self._ssh_user,
+                              ssh_pass=self._ssh_pass,
+                              ssh_key_file=self._ssh_key_file,
+                              timeout=timeout)
+        except pe.HostConnectivityError:
+            raise
+        except Exception as e:
+            raise pe.HostConnectivityError('Unable to connect host < {} >'.format(self._hostname), errors=e)
+
+    def __get_tracer(self):
+        """
+        :return: tracer of the host, the global tracer if it was not given
+        """
+        return self._tracer if self._tracer is not None else tracing.get_tracer()
 
-        client = pm.SSHClient()
-        log.info('SSHing to < {} >'.format(self._hostname))
-        if self._ssh_key_file and Path(self._ssh_key_file).is_file():
-            log.info('Try to connect with private key < {} >'.format(self._ssh_key_file))
-            try:
-                log.debug('loading private key from file...')
-                key = pm.RSAKey.from_private_key_file(self._ssh_key_file)
-                client.load_system_host_keys()
-                log.debug('adding path to known hosts file...')
-                client.load_host_keys(os.path.expanduser(hbc.FILE_KNOWN_HOSTS))
-                log.debug('setting missing host policy')
-                client.set_missing_host_key_policy(AllowAllKeys())
-                log.debug('trying to connect with client...')
-                client.connect(self._hostname, username=self._ssh_user, pkey=key)
-            except Exception as e:
-                log.exception('Failed to connect with private key!\n{}'.format(e))
-                # try to connect with user/password
-                if self._ssh_user and self._ssh_pass:
-                    log.info('Try to connect with user < {} > and password < {} >'
-                             .format(self._ssh_user, self._ssh_pass))
-                    # TODO: timeout=timeout cause "[Errno 36] Operation now in progress" problem
-                    client.connect(self._hostname, username=self._ssh_user, password=self._ssh_pass)
-                else:
-                    log.error('SSH user and password are not set!')
-                    raise pe.HostConnectivityError('Unable to connect host < {} >'.format(self._hostname))
-        return client
-
-
-class AllowAllKeys(pm.WarningPolicy):
-    def missing_host_key(self, client, hostname, key):
-        return
+    def __get_result_cache(self):
+        """
+        :return: result cache of the host, the shared default cache if it was not given
+        """
+        return self._result_cache if self._result_cache is not None else rcache.get_default_cache()
+
+    def __get_mux_client(self, timeout=0):
+        """
+        Return ssh_mux.MuxClient if SSH mux daemon is configured and running
+
+        :param timeout: SSH connect timeout used by the daemon (0 - hbc.SSH_CONNECT_TIMEOUT)
+        :return: ssh_mux.MuxClient or None
+        """
+        if not self._ssh_mux_socket:
+            return None
+        mux = ssh_mux.MuxClient(self._ssh_mux_socket, self._hostname,
+                                ssh_user=self._ssh_user,
+                                ssh_pass=self._ssh_pass,
+                                ssh_key_file=self._ssh_key_file,
+                                connect_timeout=timeout)
+        if not mux.is_available():
+            log.warning('SSH mux < {} > is not available. connecting directly...'.format(self._ssh_mux_socket))
+            return None
+        return mux
+
+
+# Kept for backward compatibility
+AllowAllKeys = rx.AllowAllKeys
@@ -3,3 +3,18 @@ Module to contain Host Base related constants
 """
 
 FILE_KNOWN_HOSTS = '~/.ssh/known_hosts'
+SSH_CONNECT_TIMEOUT = 10  # sec
+RC_TIMEOUT = 124  # same as coreutils timeout(1)
+PTY_INTERRUPT = '\x03'  # Ctrl-C
+KILL_GRACE_PERIOD = 2  # sec between SIGTERM and SIGKILL
+READ_CHUNK_SIZE = 32768
+READ_POLL_INTERVAL = 0.1  # sec
+SSH_MUX_ENV_VAR = 'DEVOPSIPY_SSH_MUX'
+SSH_MUX_SOCKET = '/tmp/devopsipy-{uid}/ssh_mux.sock'
+SSH_MUX_RUNTIME_SOCKET = '{runtime_dir}/devopsipy/ssh_mux.sock'
+SSH_MUX_IDLE_TIMEOUT = 600  # sec
+SSH_MUX_REAP_INTERVAL = 30  # sec
+SSH_MUX_START_TIMEOUT = 5  # sec
+RESULT_CACHE_TTL = 300  # sec
+RESULT_CACHE_SIZE = 1024  # results
+SHARD_POLL_INTERVAL = 0.5  # sec
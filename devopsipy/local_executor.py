@@ -0,0 +1,314 @@
+"""
+Module to contain local (localhost) command execution functionality
+
+Commands without shell syntax are executed directly (no intermediate /bin/sh),
+independent commands can be executed concurrently.
+
+Usage:
+executor = LocalExecutor(max_workers=8)
+p_lst = executor.run(['make -C lib1', 'make -C lib2', 'pytest tests/ | tee report.txt'])
+for p in executor.iter_run(['make -C lib1', 'make -C lib2']):  # as they complete
+    print(p.cmd, p.rc)
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import re
+import sys
+import time
+import codecs
+import signal
+import shutil
+import calendar
+import selectors
+import functools
+import subprocess
+from concurrent import futures
+
+# DevOpsiPy
+from . import pstate
+from . import host_base_const as hbc
+from . import callsite
+from . import tracing
+
+SHELL_SPECIAL_CHARS = frozenset('|&;<>()$`\\"\'*?[]{}~#\n')
+SHELL_ASSIGNMENT = re.compile(r'^\s*[A-Za-z_][A-Za-z0-9_]*=')
+
+
+class LocalExecutor(object):
+    """
+    Class to execute independent local commands concurrently
+
+    :param max_workers: max commands running concurrently (default: CPU count)
+    :param hostname: hostname recorded in pstate objects
+    :param ipaddr: IP address recorded in pstate objects
+    :param tracer: tracing.Tracer recording exec and read spans
+    """
+
+    def __init__(self, max_workers=0, hostname='localhost', ipaddr='127.0.0.1', tracer=tracing.NULL_TRACER):
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._hostname = hostname
+        self._ipaddr = ipaddr
+        self._tracer = tracer
+
+    def run(self, commands, timeout=0, print_stdout=False, on_output=None):
+        """
+        Execute commands concurrently
+
+        :param commands: command or list of commands
+        :param timeout: per command deadline in seconds (0 - no limit)
+        :param print_stdout: stream output to stdout as it arrives
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives (see execute())
+        :return: list of pstate objects, in commands order
+        """
+        p_lst = self._pstates(commands)
+        for _ in self._iter_execute(p_lst, timeout=timeout, print_stdout=print_stdout, on_output=on_output):
+            pass
+        return p_lst
+
+    def iter_run(self, commands, timeout=0, print_stdout=False, on_output=None, indexed=False):
+        """
+        Execute commands concurrently, yielding every pstate as soon as its command completes.
+        Closing the generator cancels the commands not started yet (running ones are not killed)
+
+        :param commands: command or list of commands
+        :param timeout: per command deadline in seconds (0 - no limit)
+        :param print_stdout: stream output to stdout as it arrives
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives (see execute())
+        :param indexed: yield (command index, pstate) tuples, e.g. to restore commands order
+        :return: generator of pstate objects (or tuples), in completion order
+        """
+        results = self._iter_execute(self._pstates(commands), timeout=timeout, print_stdout=print_stdout,
+                                     on_output=on_output)
+        return results if indexed else _without_index(results)
+
+    def _pstates(self, commands):
+        if isinstance(commands, str):
+            commands = [commands]
+        p_lst = list()
+        caller = callsite.get_external_callsite()
+        for cmd in commands:
+            p = pstate.Pstate(hostname=self._hostname)
+            p.ipaddr = self._ipaddr
+            p.caller = caller
+            p.cmd = cmd
+            p_lst.append(p)
+        return p_lst
+
+    def _iter_execute(self, p_lst, timeout=0, print_stdout=False, on_output=None):
+        log.debug('executing < {} > commands with < {} > workers'.format(len(p_lst), self._max_workers))
+        executor = futures.ThreadPoolExecutor(max_workers=min(self._max_workers, len(p_lst) or 1))
+        try:
+            fs = {executor.submit(execute, p, timeout, print_stdout, self._tracer, on_output): i
+                  for i, p in enumerate(p_lst)}
+            for f in futures.as_completed(fs):
+                yield fs[f], f.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _without_index(results):
+    """
+    :param results: generator of (index, pstate) tuples
+    :return: generator of pstate objects, closing it closes results
+    """
+    try:
+        for _, p in results:
+            yield p
+    finally:
+        results.close()
+
+
+def needs_shell(cmd):
+    """
+    Check if command uses shell syntax (pipes, redirections, globs, variables, quoting, builtins)
+
+    :param cmd: command string
+    :return: True if command has to be executed by /bin/sh, False OW
+    """
+    if not cmd.strip() or SHELL_SPECIAL_CHARS.intersection(cmd) or SHELL_ASSIGNMENT.match(cmd):
+        return True
+    return _which(cmd.split()[0]) is None
+
+
+def popen(cmd, timeout=0, new_session=False):
+    """
+    Start local command
+
+    :param cmd: command string
+    :param timeout: if set, the command is started in its own session, so its process group can be killed
+    :param new_session: start the command in its own session regardless of timeout
+    :return: subprocess.Popen
+    """
+    if needs_shell(cmd):
+        args, shell = cmd, True
+    else:
+        args, shell = cmd.split(), False
+    return subprocess.Popen(args, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=bool(timeout) or new_session)
+
+
+def execute(p, timeout=0, print_stdout=False, tracer=tracing.NULL_TRACER, on_output=None):
+    """
+    Execute pstate command locally and fill pstate results
+
+    :param p: pstate object with cmd set
+    :param timeout: command deadline in seconds (0 - no limit).
+                    timed out command is killed with its process group and gets RC hbc.RC_TIMEOUT
+    :param print_stdout: stream output to stdout as it arrives
+    :param tracer: tracing.Tracer recording exec and read spans
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives.
+                      returning True stops the command (killed with its process group), its RC is None then
+    :return: pstate object
+    """
+    log.debug('executing command --> {}'.format(p.cmd))
+    p.epoch = calendar.timegm(time.gmtime())
+    start = time.time()
+    with tracer.span('exec', cat='command', host=p.hostname, cmd=p.cmd):
+        prc = popen(p.cmd, timeout=timeout)
+    p.pid = prc.pid
+
+    with tracer.span('read', cat='command', host=p.hostname, cmd=p.cmd) as span:
+        stdout, stderr, p.timed_out, stopped = _read_process(prc, timeout=timeout, print_stdout=print_stdout,
+                                                             on_output=on_output)
+        p.stdout = [line.rstrip() for line in stdout.splitlines()]
+        p.stderr = [line.rstrip() for line in stderr.splitlines()]
+        if not (p.timed_out or stopped):
+            # the command may close its stdio and keep running, EOF is not its exit
+            p.timed_out, p.rc = _wait(prc, _remaining(start, timeout))
+        if p.timed_out:
+            log.error('Command < {} > timed out after < {} > sec. killing process group...'.format(p.cmd, timeout))
+            _kill_process_group(prc)
+            p.rc = hbc.RC_TIMEOUT
+        elif stopped:
+            if timeout:
+                _kill_process_group(prc)
+            else:
+                prc.kill()
+                prc.wait()
+            p.rc = None
+        span.args['rc'] = p.rc
+    prc.stdout.close()
+    prc.stderr.close()
+    p.runtime = time.time() - start
+    return p
+
+
+def follow(cmd, timeout=0, on_output=None):
+    """
+    Execute local command passing its output to on_output as it arrives, until it exits,
+    the deadline passes or on_output asks to stop. Stopped or timed out command is killed with its process group
+
+    :param cmd: command string
+    :param timeout: command deadline in seconds (0 - no limit)
+    :param on_output: callable(text, is_stderr) called for every output chunk, returning True stops the command
+    :return: (stdout str, stderr str, rc int, timed_out bool), rc is None if stopped by on_output
+    """
+    log.debug('following command --> {}'.format(cmd))
+    start = time.time()
+    prc = popen(cmd, new_session=True)
+    try:
+        stdout, stderr, timed_out, stopped = _read_process(prc, timeout=timeout, on_output=on_output)
+        if not (timed_out or stopped):
+            timed_out, rc = _wait(prc, _remaining(start, timeout))
+            if not timed_out:
+                return stdout, stderr, rc, False
+        _kill_process_group(prc)
+        return stdout, stderr, hbc.RC_TIMEOUT if timed_out else None, timed_out
+    finally:
+        prc.stdout.close()
+        prc.stderr.close()
+
+
+@functools.lru_cache(maxsize=256)
+def _which(executable):
+    return shutil.which(executable)
+
+
+def _read_process(prc, timeout=0, print_stdout=False, on_output=None):
+    """
+    Read local process stdout and stderr until both are closed or the deadline passes
+
+    :param prc: subprocess.Popen with stdout and stderr pipes
+    :param timeout: deadline in seconds (0 - no limit)
+    :param print_stdout: stream output to stdout as it arrives
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives, returning True stops
+    :return: (stdout str, stderr str, timed_out bool, stopped bool)
+    """
+    deadline = time.time() + timeout if timeout else None
+    sel = selectors.DefaultSelector()
+    out = dict()
+    for idx, pipe in enumerate((prc.stdout, prc.stderr)):
+        sel.register(pipe, selectors.EVENT_READ, data=idx)
+        out[idx] = (codecs.getincrementaldecoder('UTF-8')(errors='replace'), list())
+    try:
+        while sel.get_map():
+            wait = None
+            if deadline:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return ''.join(out[0][1]), ''.join(out[1][1]), True, False
+            for key, _ in sel.select(wait):
+                data = os.read(key.fd, hbc.READ_CHUNK_SIZE)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    continue
+                decoder, chunks = out[key.data]
+                text = decoder.decode(data)
+                chunks.append(text)
+                if print_stdout:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                if on_output is not None and on_output(text, bool(key.data)):
+                    return ''.join(out[0][1]), ''.join(out[1][1]), False, True
+    finally:
+        sel.close()
+    return ''.join(out[0][1]), ''.join(out[1][1]), False, False
+
+
+def _remaining(start, timeout):
+    """
+    :param start: command start time
+    :param timeout: command deadline in seconds (0 - no limit)
+    :return: seconds left until the deadline, None if there is no deadline
+    """
+    if not timeout:
+        return None
+    return max(0, start + timeout - time.time())
+
+
+def _wait(prc, timeout=None):
+    """
+    Wait for local process exit
+
+    :param prc: subprocess.Popen
+    :param timeout: seconds to wait (None - no limit)
+    :return: (timed_out bool, rc int), rc is None if timed out
+    """
+    try:
+        return False, prc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return True, None
+
+
+def _kill_process_group(prc):
+    """
+    Terminate process group of a process started with start_new_session=True, kill it if it does not exit
+
+    :param prc: subprocess.Popen
+    """
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(prc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            prc.wait(timeout=hbc.KILL_GRACE_PERIOD)
+            break
+        except subprocess.TimeoutExpired:
+            log.warning('Process group < {} > did not exit on {}'.format(prc.pid, sig.name))
@@ -0,0 +1,290 @@
+"""
+Module to contain indexed search over run logs (LOG_DIR_BASE, /tmp/logs)
+
+Every log file gets a sidecar index (<log file>.idx) with offset, timestamp, level and logger
+of every record. The index is built lazily on the first query and extended incrementally
+with the records appended since, so only new bytes are ever scanned.
+Queries binary search the index by time, filter by level and logger without touching the log,
+and read only the matching records from the memory-mapped log file.
+Hosts are not indexed (records mention them in free text), the host filter searches
+the records left after the indexed filters.
+
+Usage:
+for record in log_index.query(since='7d', level='ERROR', host='web1'):
+    print(record)
+
+Command line:
+python -m devopsipy.log_index --since 7d --level ERROR --host web1
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import re
+import sys
+import glob
+import mmap
+import time
+import zlib
+import struct
+import argparse
+from collections import namedtuple
+
+# DevOpsiPy
+from . import logger_const as lc
+
+INDEX_MAGIC = b'DPYIDX01'
+INDEX_HEADER = struct.Struct('<8sQQQ')  # magic, log inode, indexed bytes, records count
+INDEX_RECORD = struct.Struct('<QIIB3x')  # offset, epoch, logger crc32, level
+RECORD_PATTERN = re.compile(lc.LOG_RECORD_PATTERN, re.MULTILINE)
+RELATIVE_TIME_PATTERN = re.compile(r'^(\d+)([smhdw])$')
+RELATIVE_TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+class LogRecord(namedtuple('LogRecord', ['epoch', 'level', 'logger', 'text', 'path', 'offset'])):
+    """
+    Class to represent a log record found by query
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.text
+
+
+class LogIndex(object):
+    """
+    Class to represent sidecar index of a single log file
+
+    :param path: log file path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + lc.LOG_INDEX_EXTENSION
+        self._ts_cache = (None, 0)  # last parsed timestamp minute and its epoch
+
+    def update(self):
+        """
+        Build the index or extend it with records appended to the log since the last update.
+        The index is rebuilt if the log was rotated (inode changed) or truncated
+
+        :return: number of records in the index
+        """
+        st = os.stat(self.path)
+        inode, indexed, count = self._read_header()
+        if inode != st.st_ino or indexed > st.st_size:
+            log.debug('building index for < {} >'.format(self.path))
+            inode, indexed, count = st.st_ino, 0, 0
+            open(self.index_path, 'wb').close()
+        if indexed == st.st_size:
+            return count
+
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            # index complete lines only, the last one may be still written
+            end = buf.rfind(b'\n', indexed) + 1
+            if not end:
+                return count
+            records = bytearray()
+            pack = INDEX_RECORD.pack
+            fields = dict()  # (logger, level name) --> (logger crc32, level number)
+            for m in RECORD_PATTERN.finditer(buf, indexed, end):
+                ts, name, level = m.groups()
+                if (name, level) not in fields:
+                    fields[name, level] = (zlib.crc32(name), _level_number(level.decode(), default=0))
+                records += pack(m.start(), self._epoch(ts), *fields[name, level])
+                count += 1
+
+        with open(self.index_path, 'r+b') as f:
+            f.seek(INDEX_HEADER.size + (count * INDEX_RECORD.size) - len(records))
+            f.write(records)
+            f.truncate()
+            f.seek(0)
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, inode, end, count))
+        log.debug('index of < {} > updated. records: < {} >'.format(self.path, count))
+        return count
+
+    def query(self, since=None, until=None, level=None, logger=None, host=None):
+        """
+        Find log records
+
+        :param since: epoch, records from (inclusive)
+        :param until: epoch, records until (inclusive)
+        :param level: minimal level name or number, e.g. 'ERROR'
+        :param logger: logger name
+        :param host: host name the record mentions as a whole word (web1 does not match web10),
+                     searched in the records left after the indexed filters
+        :return: generator of LogRecord objects
+        """
+        count = self.update()
+        if not count:
+            return
+        level = _level_number(level)
+        logger = logger.encode() if logger else None
+        logger_crc = zlib.crc32(logger) if logger else None
+        host_pattern = _host_pattern(host) if host else None
+        with open(self.index_path, 'rb') as fi, mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ) as idx, \
+                open(self.path, 'rb') as fl, mmap.mmap(fl.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            indexed = INDEX_HEADER.unpack_from(idx)[2]
+            # records may be written out of order within a second (asctime is taken before the handler lock)
+            first = self._bisect(idx, count, since - 1) if since else 0
+            for i in range(first, count):
+                offset, epoch, crc, lvl = INDEX_RECORD.unpack_from(idx, INDEX_HEADER.size + i * INDEX_RECORD.size)
+                if until and epoch > until + 1:
+                    break
+                if (since and epoch < since) or (until and epoch > until) or (level and lvl < level) or \
+                        (logger_crc is not None and crc != logger_crc):
+                    continue
+                end = indexed if i + 1 == count else \
+                    INDEX_RECORD.unpack_from(idx, INDEX_HEADER.size + (i + 1) * INDEX_RECORD.size)[0]
+                data = buf[offset:end]
+                if host_pattern is not None and not host_pattern.search(data):
+                    continue
+                m = RECORD_PATTERN.match(data)
+                if logger and m.group(2) != logger:
+                    # crc32 collision
+                    continue
+                yield LogRecord(epoch, m.group(3).decode(), m.group(2).decode(),
+                                data.decode(encoding='UTF-8', errors='replace').rstrip(), self.path, offset)
+
+    def _read_header(self):
+        """
+        :return: (log inode, indexed bytes, records count), zeros if there is no valid index
+        """
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, inode, indexed, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        except (OSError, struct.error):
+            return 0, 0, 0
+        if magic != INDEX_MAGIC:
+            return 0, 0, 0
+        return inode, indexed, count
+
+    @staticmethod
+    def _bisect(idx, count, epoch):
+        """
+        :return: index of the first record with timestamp >= epoch
+        """
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX_RECORD.unpack_from(idx, INDEX_HEADER.size + mid * INDEX_RECORD.size)[1] < epoch:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _epoch(self, ts):
+        # consecutive records mostly share the same minute, only seconds are parsed for them
+        minute = ts[:16]
+        if minute != self._ts_cache[0]:
+            self._ts_cache = (minute, int(time.mktime(time.strptime(minute.decode(), lc.LOG_DATE_FORMAT[:-3]))))
+        return self._ts_cache[1] + int(ts[17:19])
+
+
+# -------------------------------
+# Queries over all runs
+
+def log_files(log_dir=lc.LOG_DIR_BASE, run_name=None, level=None, since=None):
+    """
+    Return log files of all runs in chronological order, rotated backups first.
+    ERROR and above are searched in error logs, anything else in debug logs
+
+    :param log_dir: logs base directory
+    :param run_name: logger name given to set_logger() (default: all runs)
+    :param level: minimal level
+    :param since: epoch, skip files last modified before
+    :return: list of paths
+    """
+    level = _level_number(level)
+    extension = lc.LOG_FILE_EXTENSION_ERROR if level and level >= logging.ERROR else lc.LOG_FILE_EXTENSION_DEBUG
+    pattern = os.path.join(log_dir, '{}_*'.format(run_name) if run_name else '*', '*' + extension)
+    files = list()
+    # run directories are named <run name>_%Y%m%d_%H%M%S
+    for path in sorted(glob.glob(pattern), key=lambda p: os.path.basename(os.path.dirname(p)).rsplit('_', 2)[-2:]):
+        backups = [b for b in glob.glob(path + '.[0-9]*') if not b.endswith(lc.LOG_INDEX_EXTENSION)]
+        backups.sort(key=lambda b: int(b.rsplit('.', 1)[1]), reverse=True)
+        for f in backups + [path]:
+            if since and os.path.getmtime(f) < since:
+                continue
+            files.append(f)
+    return files
+
+
+def query(since=None, until=None, level=None, logger=None, host=None, log_dir=lc.LOG_DIR_BASE, run_name=None):
+    """
+    Find log records over all runs
+
+    :param since: epoch, datetime string ('%Y-%m-%d %H:%M:%S') or relative time ('30m', '2h', '7d')
+    :param until: same as since
+    :param level: minimal level name or number
+    :param logger: logger name
+    :param host: host name the record mentions
+    :param log_dir: logs base directory
+    :param run_name: logger name given to set_logger() (default: all runs)
+    :return: generator of LogRecord objects
+    """
+    since, until = parse_time(since), parse_time(until)
+    for path in log_files(log_dir=log_dir, run_name=run_name, level=level, since=since):
+        for record in LogIndex(path).query(since=since, until=until, level=level, logger=logger, host=host):
+            yield record
+
+
+def parse_time(value):
+    """
+    Convert epoch, datetime string or relative time ('30m', '2h', '7d') to epoch
+
+    :return: epoch or None
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    m = RELATIVE_TIME_PATTERN.match(value)
+    if m:
+        return int(time.time()) - int(m.group(1)) * RELATIVE_TIME_UNITS[m.group(2)]
+    return int(time.mktime(time.strptime(value, lc.LOG_DATE_FORMAT)))
+
+
+def _host_pattern(host):
+    """
+    :return: compiled bytes pattern matching host name not being a part of a longer name,
+             e.g. web1 matches 'web1:', 'web1.example.com' but not 'web10' or 'db-web1'
+    """
+    return re.compile(rb'(?<![\w.-])' + re.escape(host.encode()) + rb'(?![\w-])')
+
+
+def _level_number(level, default=None):
+    """
+    Convert level name to number
+
+    :param level: level name or number
+    :param default: returned for unknown level names, ValueError is raised if not set
+    """
+    if level is None or isinstance(level, int):
+        return level
+    number = logging.getLevelName(level.upper())
+    if not isinstance(number, int):
+        if default is not None:
+            return default
+        raise ValueError('Unknown log level < {} >'.format(level))
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search DevOpsiPy run logs')
+    parser.add_argument('--since', help="'%%Y-%%m-%%d %%H:%%M:%%S' or relative: 30m, 2h, 7d")
+    parser.add_argument('--until', help="'%%Y-%%m-%%d %%H:%%M:%%S' or relative: 30m, 2h, 7d")
+    parser.add_argument('--level', help='minimal level, e.g. ERROR')
+    parser.add_argument('--logger', help='logger name')
+    parser.add_argument('--host', help='host name the record mentions')
+    parser.add_argument('--run', dest='run_name', help='run (logger) name given to set_logger()')
+    parser.add_argument('--dir', dest='log_dir', default=lc.LOG_DIR_BASE, help='logs base directory')
+    args = parser.parse_args()
+    for record in query(**vars(args)):
+        sys.stdout.write(record.text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -15,8 +15,8 @@ __author__ = 'sergey kharnam'
 
 
 import os
-import logger_const as lc
-import utils as pu
+from . import logger_const as lc
+from . import utils as pu
 import logging
 import logging.config
 from logging.handlers import RotatingFileHandler
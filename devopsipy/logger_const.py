@@ -13,6 +13,10 @@ LOG_FILE_EXTENSION_DEBUG = '.debug.log'
 LOG_FILE_SYMLINK_INFO = LOG_DIR_BASE + 'latest.info'
 LOG_FILE_SYMLINK_ERROR = LOG_DIR_BASE + 'latest.error'
 LOG_FILE_SYMLINK_DEBUG = LOG_DIR_BASE + 'latest.debug'
+LOG_INDEX_EXTENSION = '.idx'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# record start in 'default' formatter format (logger.yml), groups: asctime, name, levelname
+LOG_RECORD_PATTERN = rb'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) - (\S+) - \[ *(\w+)\] - '
 
 LOG_ENV_VAR_NAME = 'LOG_CFG'
 LOG_DEFAULT_CONFIG_PATH = PYWORK_BASE + '/logger.yml'
@@ -4,6 +4,10 @@ Module to contain 'process state' object (pstate) related functionality
 
 __author__ = 'sergey kharnam'
 
+# stdlib
+import time
+import calendar
+
 
 class Pstate(object):
     """
@@ -17,7 +21,12 @@ class Pstate(object):
     - cmd (str) -- executed cmd
     - stdout (list) -- stdout
     - stderr (list)` -- stderr
+    - timed_out (bool) -- command was killed on timeout
+    - caller (CallSite) -- automation step (class, function, file, line) which issued the command
+    - cached (bool) -- result was served from the result cache, not executed
     """
+    FIELDS = ('hostname', 'ipaddr', 'rc', 'pid', 'epoch', 'runtime', 'cmd', 'stdout', 'stderr', 'timed_out',
+              'caller', 'cached')
 
     def __init__(self, rc=-1, hostname='unknown'):
         """
@@ -38,6 +47,9 @@ class Pstate(object):
         self.cmd = str()
         self.stdout = list()
         self.stderr = list()
+        self.timed_out = False
+        self.caller = None
+        self.cached = False
 
     def __repr__(self):
         """
@@ -60,7 +72,47 @@ class Pstate(object):
             'HOST: ' + self.hostname,
             'IPADDR: ' + self.ipaddr,
             'RUNTIME: ' + str(self.runtime),
+            'TIMED OUT: ' + str(self.timed_out),
+            'CALLER: ' + str(self.caller),
+            'CACHED: ' + str(self.cached),
             'STDOUT: ' + str(self.stdout),
             'STDERR: ' + str(self.stderr)
         ]
         return '\n' + '\n'.join(pstate_data) + '\n'
+
+    def to_tuple(self):
+        """
+        Compact representation for passing between processes (see from_tuple())
+
+        :returns: tuple of FIELDS values
+        """
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    @classmethod
+    def from_tuple(cls, values):
+        """
+        Create pstate from to_tuple() representation
+
+        :param values: tuple of FIELDS values
+        :returns: pstate object
+        """
+        p = cls()
+        p.__dict__.update(zip(cls.FIELDS, values))
+        return p
+
+
+def failed_pstate(hostname, commands, reason):
+    """
+    Create pstate representing a host which did not return results (unreachable, crashed, timed out)
+
+    :param hostname: hostname
+    :param commands: command or list of commands the host was given
+    :param reason: error message, stored in stderr
+    :returns: pstate object with the default RC
+    """
+    p = Pstate(hostname=str(hostname))
+    p.epoch = calendar.timegm(time.gmtime())
+    p.cmd = commands if isinstance(commands, str) else '; '.join(commands)
+    p.stderr.append(reason)
+    return p
+
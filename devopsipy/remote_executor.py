@@ -0,0 +1,213 @@
+"""
+Module to contain remote (SSH) command execution functionality
+
+Usage:
+client = connect('my_remote_machine.example.com', ssh_user='user', ssh_key_file='~/.ssh/id_rsa')
+p = execute(client, p, timeout=60)
+client.close()
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import sys
+import time
+import codecs
+import select
+from pathlib import Path
+
+# PyPi
+import paramiko as pm
+
+# DevOpsiPy
+from . import exceptions as pe
+from . import host_base_const as hbc
+from . import tracing
+
+
+class AllowAllKeys(pm.WarningPolicy):
+    def missing_host_key(self, client, hostname, key):
+        return
+
+
+def connect(hostname, ssh_user=None, ssh_pass=None, ssh_key_file=None, timeout=0):
+    """
+    Return paramiko.SSHClient object after establishing authentication:
+    private key (user/password fallback), user/password if there is no key file, SSH agent and default keys OW
+
+    :param hostname: FQDN or IP
+    :param ssh_user: ssh user
+    :param ssh_pass: ssh password
+    :param ssh_key_file: ssh private key file path
+    :param timeout: connect, banner and auth timeout in seconds (0 - hbc.SSH_CONNECT_TIMEOUT)
+    :return: paramiko.SSHClient
+    """
+    timeout = timeout or hbc.SSH_CONNECT_TIMEOUT
+    connect_kwargs = dict(username=ssh_user, timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+    client = pm.SSHClient()
+    log.info('SSHing to < {} >'.format(hostname))
+    if ssh_key_file and Path(ssh_key_file).is_file():
+        log.info('Try to connect with private key < {} >'.format(ssh_key_file))
+        try:
+            log.debug('loading private key from file...')
+            key = pm.RSAKey.from_private_key_file(ssh_key_file)
+            client.load_system_host_keys()
+            log.debug('adding path to known hosts file...')
+            client.load_host_keys(os.path.expanduser(hbc.FILE_KNOWN_HOSTS))
+            log.debug('setting missing host policy')
+            client.set_missing_host_key_policy(AllowAllKeys())
+            log.debug('trying to connect with client...')
+            client.connect(hostname, pkey=key, **connect_kwargs)
+        except Exception as e:
+            log.exception('Failed to connect with private key!\n{}'.format(e))
+            # try to connect with user/password
+            if ssh_user and ssh_pass:
+                log.info('Try to connect with user < {} > and password < {} >'.format(ssh_user, ssh_pass))
+                client.connect(hostname, password=ssh_pass, **connect_kwargs)
+            else:
+                log.error('SSH user and password are not set!')
+                raise pe.HostConnectivityError('Unable to connect host < {} >'.format(hostname))
+    else:
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(AllowAllKeys())
+        if ssh_pass:
+            log.info('Try to connect with user < {} > and password'.format(ssh_user))
+            client.connect(hostname, password=ssh_pass, **connect_kwargs)
+        else:
+            log.info('Try to connect with SSH agent and default keys')
+            client.connect(hostname, **connect_kwargs)
+    return client
+
+
+def execute(client, p, timeout=0, print_stdout=False, tracer=tracing.NULL_TRACER, on_output=None, get_pty=False):
+    """
+    Execute pstate command over a new SSH channel and fill pstate results
+
+    :param client: connected paramiko.SSHClient
+    :param p: pstate object with cmd set
+    :param timeout: command deadline in seconds (0 - no limit)
+    :param print_stdout: stream output to stdout as it arrives
+    :param tracer: tracing.Tracer recording open, exec, read and close spans
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives (see exec_command())
+    :param get_pty: run the command with a PTY (see exec_channel())
+    :return: pstate object
+    """
+    start = time.time()
+    try:
+        p.stdout, p.stderr, p.rc, p.timed_out = exec_command(client.get_transport(), p.cmd, timeout=timeout,
+                                                             print_stdout=print_stdout, on_output=on_output,
+                                                             get_pty=get_pty, tracer=tracer, host=p.hostname)
+        if p.timed_out:
+            log.error('Command < {} > on host < {} > timed out after < {} > sec'.format(p.cmd, p.hostname, timeout))
+    finally:
+        p.runtime = time.time() - start
+    return p
+
+
+def exec_command(transport, cmd, timeout=0, print_stdout=False, on_output=None, get_pty=False,
+                 tracer=tracing.NULL_TRACER, host=None):
+    """
+    Execute command over a new SSH channel (see exec_channel())
+
+    :param transport: authenticated paramiko.Transport
+    :param cmd: command string
+    :param timeout: command deadline in seconds (0 - no limit)
+    :param print_stdout: stream output to stdout as it arrives
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives.
+                      returning True stops the command, its RC is None then
+    :param get_pty: run the command with a PTY (see exec_channel())
+    :param tracer: tracing.Tracer recording open, exec, read and close spans
+    :param host: hostname recorded in trace spans
+    :return: (stdout str, stderr str, rc int, timed_out bool)
+    """
+    with tracer.span('open', cat='command', host=host, cmd=cmd):
+        chan = transport.open_session()
+    return exec_channel(chan, cmd, timeout=timeout, print_stdout=print_stdout, on_output=on_output, get_pty=get_pty,
+                        tracer=tracer, host=host)
+
+
+def exec_channel(chan, cmd, timeout=0, print_stdout=False, on_output=None, get_pty=False,
+                 tracer=tracing.NULL_TRACER, host=None, cancelled=None):
+    """
+    Execute command over an opened SSH channel, the channel is closed when the command is done, timed out or stopped.
+    With get_pty the command runs on a PTY: on timeout (or stop) it is interrupted and the channel close delivers
+    SIGHUP to the remote process group, but stderr is merged into stdout and line endings become \\r\\n.
+    Without PTY the channel close only closes the command pipes, it gets SIGPIPE on its next write
+
+    :param chan: new paramiko.Channel (transport.open_session())
+    :param cmd: command string
+    :param timeout: command deadline in seconds (0 - no limit)
+    :param print_stdout: stream output to stdout as it arrives
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives.
+                      returning True stops the command, its RC is None then
+    :param get_pty: run the command with a PTY
+    :param tracer: tracing.Tracer recording exec, read and close spans
+    :param host: hostname recorded in trace spans
+    :param cancelled: callable() polled while there is no output, returning True stops the command as on_output does
+    :return: (stdout str, stderr str, rc int, timed_out bool)
+    """
+    try:
+        with tracer.span('exec', cat='command', host=host, cmd=cmd):
+            if get_pty:
+                chan.get_pty()
+            chan.exec_command(cmd)
+        with tracer.span('read', cat='command', host=host, cmd=cmd) as span:
+            stdout, stderr, timed_out, stopped = _read_channel(chan, timeout=timeout, print_stdout=print_stdout,
+                                                               on_output=on_output, cancelled=cancelled)
+            if timed_out or stopped:
+                if get_pty:
+                    chan.send(hbc.PTY_INTERRUPT)
+                rc = hbc.RC_TIMEOUT if timed_out else None
+            else:
+                rc = chan.recv_exit_status()
+            span.args['rc'] = rc
+        return stdout, stderr, rc, timed_out
+    finally:
+        with tracer.span('close', cat='command', host=host, cmd=cmd):
+            chan.close()
+
+
+def _read_channel(chan, timeout=0, print_stdout=False, on_output=None, cancelled=None):
+    """
+    Read SSH channel stdout and stderr until the command exits or the deadline passes
+
+    :param chan: paramiko.Channel with executed command
+    :param timeout: deadline in seconds (0 - no limit)
+    :param print_stdout: stream output to stdout as it arrives
+    :param on_output: callable(text, is_stderr) called for every output chunk as it arrives, returning True stops
+    :param cancelled: callable() polled while there is no output, returning True stops
+    :return: (stdout str, stderr str, timed_out bool, stopped bool)
+    """
+    deadline = time.time() + timeout if timeout else None
+    decoders = [codecs.getincrementaldecoder('UTF-8')(errors='replace') for _ in range(2)]
+    out = [list(), list()]
+    while True:
+        if chan.recv_ready():
+            idx, data = 0, chan.recv(hbc.READ_CHUNK_SIZE)
+        elif chan.recv_stderr_ready():
+            idx, data = 1, chan.recv_stderr(hbc.READ_CHUNK_SIZE)
+        elif chan.closed or (chan.exit_status_ready() and chan.eof_received):
+            break
+        elif cancelled is not None and cancelled():
+            return ''.join(out[0]), ''.join(out[1]), False, True
+        else:
+            wait = hbc.READ_POLL_INTERVAL
+            if deadline:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return ''.join(out[0]), ''.join(out[1]), True, False
+                wait = min(wait, hbc.READ_POLL_INTERVAL)
+            select.select([chan], [], [], wait)
+            continue
+        text = decoders[idx].decode(data)
+        out[idx].append(text)
+        if print_stdout:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        if on_output is not None and on_output(text, bool(idx)):
+            return ''.join(out[0]), ''.join(out[1]), False, True
+    return ''.join(out[0]), ''.join(out[1]), False, False
@@ -0,0 +1,134 @@
+"""
+Module to contain TTL memoization of read-only command results
+
+Results are kept per (hostname, ssh user, command) in LRU order, expired by TTL and evicted when the cache is full.
+Only successful results are cached. Cached results are returned as copies flagged with pstate.cached,
+so callers can't modify the cached data.
+
+Usage:
+host.run('uname -r', cache=True)  # executed
+host.run('uname -r', cache=True)  # served from the cache, pstate.cached is True
+host.invalidate_cache('uname -r')
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+# DevOpsiPy
+from . import host_base_const as hbc
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class ResultCache(object):
+    """
+    Class to represent thread safe TTL + LRU cache of command results
+
+    :param ttl: seconds a result stays valid
+    :param max_size: max number of cached results, the least recently used are evicted
+    """
+
+    def __init__(self, ttl=hbc.RESULT_CACHE_TTL, max_size=hbc.RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()  # (hostname, user, cmd) --> (expiry time, pstate)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, hostname, cmd, user=None):
+        """
+        Return a copy of the cached result
+
+        :param hostname: hostname
+        :param cmd: command string
+        :param user: ssh user the command was executed as (the output of id, whoami, cat ~/.x depends on it)
+        :return: pstate object with cached flag set, None if not cached or expired
+        """
+        key = (hostname, user, cmd)
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._results[key]
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            p = entry[1]
+        log.debug('cache hit on host < {} > --> {}'.format(hostname, cmd))
+        return _copy(p)
+
+    def put(self, p, user=None):
+        """
+        Cache result of a successful command
+
+        :param p: pstate object
+        :param user: ssh user the command was executed as
+        :return: True if cached, False OW
+        """
+        if p.rc != 0 or p.timed_out:
+            return False
+        key = (p.hostname, user, p.cmd)
+        p = _copy(p)
+        with self._lock:
+            self._results[key] = (time.monotonic() + self.ttl, p)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return True
+
+    def invalidate(self, hostname=None, cmd=None, user=None):
+        """
+        Drop cached results
+
+        :param hostname: hostname (default: all hosts)
+        :param cmd: command string (default: all commands)
+        :param user: ssh user (default: all users)
+        :return: number of dropped results
+        """
+        with self._lock:
+            keys = [k for k in self._results if (hostname is None or k[0] == hostname) and
+                    (user is None or k[1] == user) and (cmd is None or k[2] == cmd)]
+            for key in keys:
+                del self._results[key]
+        log.debug('invalidated < {} > cached results'.format(len(keys)))
+        return len(keys)
+
+    def clear(self):
+        """
+        Drop all cached results
+        """
+        with self._lock:
+            self._results.clear()
+
+
+def get_default_cache():
+    """
+    :return: ResultCache shared by hosts not given their own cache
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+
+def _copy(p):
+    p = copy.copy(p)
+    p.stdout = copy.copy(p.stdout)
+    p.stderr = copy.copy(p.stderr)
+    p.cached = True
+    return p
@@ -0,0 +1,188 @@
+"""
+Module to contain rolling-wave execution scheduler
+
+Usage:
+hosts = [HostBase(h, ssh_user='user', ssh_key_file='~/.ssh/id_rsa') for h in host_names]
+scheduler = WaveScheduler(hosts, wave_percent=10, max_failures=2)
+results = scheduler.run(['systemctl restart my_service'])
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import math
+import threading
+from concurrent import futures
+
+# DevOpsiPy
+from . import pstate
+from . import exceptions as pe
+
+
+class WaveScheduler(object):
+    """
+    Class to run commands over a set of hosts in rolling waves
+
+    Hosts are split into waves by count (wave_size) or by percentage (wave_percent).
+    Every wave runs concurrently and results are evaluated as they arrive:
+    - a host is failed if HostBase.run() raised or any of its commands returned non-zero RC
+    - the rollout is aborted as soon as failed hosts count exceeds max_failures,
+      without waiting for the rest of the wave
+    - hosts still running after wave_timeout are counted as failed, and if the failures
+      threshold allows, the next wave starts without waiting for them
+    - hosts still running when the rollout is aborted or their wave timed out
+      are stopped after their current command
+
+    :param hosts: list of HostBase objects
+    :param wave_size: number of hosts per wave
+    :param wave_percent: percent of hosts per wave (used when wave_size is not set)
+    :param max_failures: number of failed hosts tolerated before the rollout is aborted
+    :param max_workers: max hosts running concurrently inside a wave (default: wave size)
+    :param wave_timeout: seconds to wait for a wave before giving up on its stragglers (0 - no limit)
+    :param aggregator: optional OutputAggregator, fed with results as they arrive
+    """
+
+    def __init__(self, hosts,
+                 wave_size=0,
+                 wave_percent=0,
+                 max_failures=0,
+                 max_workers=0,
+                 wave_timeout=0,
+                 aggregator=None):
+
+        if wave_size < 0 or not 0 <= wave_percent <= 100:
+            raise pe.PyworkException('Invalid wave size < {} > or wave percent < {} >'
+                                     .format(wave_size, wave_percent))
+        self._hosts = list(hosts)
+        self._wave_size = wave_size
+        self._wave_percent = wave_percent
+        self._max_failures = max_failures
+        self._max_workers = max_workers
+        self._wave_timeout = wave_timeout
+        self._aggregator = aggregator
+
+        # -------------------------------
+        # Rollout State
+
+        self.results = dict()  # hostname --> list of pstate objects
+        self.failed_hosts = list()
+        self.aborted = False
+
+    def waves(self):
+        """
+        Split hosts into waves
+
+        :return: list of host lists
+        """
+        if self._wave_size:
+            size = self._wave_size
+        elif self._wave_percent:
+            size = int(math.ceil(len(self._hosts) * self._wave_percent / 100.0))
+        else:
+            size = len(self._hosts)
+        size = max(size, 1)
+        return [self._hosts[i:i + size] for i in range(0, len(self._hosts), size)]
+
+    def run(self, commands, **run_kwargs):
+        """
+        Run commands on all hosts wave by wave
+
+        :param commands: command or list of commands
+        :param run_kwargs: keyword arguments passed as is to HostBase.iter_run()
+        :return: dict of hostname --> list of pstate objects, in completion order
+        """
+        self.results = dict()
+        self.failed_hosts = list()
+        self.aborted = False
+
+        waves = self.waves()
+        for i, wave in enumerate(waves, start=1):
+            log.info('Starting wave {}/{} with < {} > hosts...'.format(i, len(waves), len(wave)))
+            self._run_wave(wave, commands, run_kwargs)
+            if self.aborted:
+                log.critical('Rollout aborted at wave {}/{}. failed hosts: {}'.format(i, len(waves), self.failed_hosts))
+                raise pe.HostCommandExecutionError('Rollout aborted: < {} > hosts failed, max failures < {} >'
+                                                   .format(len(self.failed_hosts), self._max_failures),
+                                                   errors=self.results)
+            log.info('Wave {}/{} done. failed hosts so far: < {} >'.format(i, len(waves), len(self.failed_hosts)))
+        return self.results
+
+    @staticmethod
+    def is_success(p_lst):
+        """
+        Check all commands of a host succeeded
+
+        :param p_lst: list of pstate objects
+        :return: True if all RCs are 0, False OW
+        """
+        return bool(p_lst) and all(p.rc == 0 for p in p_lst)
+
+    def _run_wave(self, wave, commands, run_kwargs):
+        """
+        Run a single wave concurrently and evaluate results as they arrive
+
+        :param wave: list of HostBase objects
+        :param commands: command or list of commands
+        :param run_kwargs: keyword arguments for HostBase.iter_run()
+        """
+        cancel = threading.Event()
+        executor = futures.ThreadPoolExecutor(max_workers=self._max_workers or len(wave))
+        pending = {executor.submit(self._run_host, host, commands, run_kwargs, cancel): host for host in wave}
+        try:
+            for f in futures.as_completed(list(pending), timeout=self._wave_timeout or None):
+                host = pending.pop(f)
+                p_lst = f.result()
+                self.results[str(host)] = p_lst
+                if self._aggregator is not None:
+                    self._aggregator.add_all(p_lst)
+                if not self.is_success(p_lst):
+                    self._set_failed(host)
+                    if self.aborted:
+                        break
+        except futures.TimeoutError:
+            for host in pending.values():
+                log.warning('Host < {} > did not finish in < {} > sec. not waiting for it'
+                            .format(host, self._wave_timeout))
+                self.results[str(host)] = [pstate.failed_pstate(host, commands, 'wave timeout expired')]
+                self._set_failed(host)
+        finally:
+            # don't wait for stragglers -- their results are not collected anymore,
+            # they stop after their current command
+            if pending:
+                log.info('stopping execution on < {} > hosts'.format(len(pending)))
+                cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_host(self, host, commands, run_kwargs, cancel):
+        """
+        Run commands on a single host until done or cancelled, converting exceptions into failed pstate
+
+        :return: list of pstate objects
+        """
+        p_lst = list()
+        try:
+            if cancel.is_set():
+                return p_lst
+            stream = host.iter_run(commands, **run_kwargs)
+            try:
+                for p in stream:
+                    p_lst.append(p)
+                    if cancel.is_set():
+                        break
+            finally:
+                stream.close()
+            return p_lst
+        except Exception as e:
+            log.error('Execution on host < {} > failed: {}'.format(host, e))
+            return [pstate.failed_pstate(host, commands, str(e))]
+
+    def _set_failed(self, host):
+        """
+        Register failed host and update the abort state
+        """
+        self.failed_hosts.append(str(host))
+        if len(self.failed_hosts) > self._max_failures:
+            self.aborted = True
@@ -0,0 +1,412 @@
+"""
+Module to contain shared SSH multiplexing daemon (similar to OpenSSH ControlMaster)
+
+The daemon holds authenticated SSH transports to hosts and executes commands over new channels
+of them on behalf of client processes, which talk to it over a Unix domain socket.
+Short-lived processes get a ready channel without negotiating a new SSH session.
+
+Usage:
+python -m devopsipy.ssh_mux [--socket PATH] [--idle-timeout SEC]  # or ssh_mux.start_daemon()
+export DEVOPSIPY_SSH_MUX=$XDG_RUNTIME_DIR/devopsipy/ssh_mux.sock  # or HostBase(..., ssh_mux_socket=PATH)
+
+The socket directory must be owned by the current user and not accessible by others (like OpenSSH ControlPath),
+the daemon refuses to start and clients refuse to send credentials otherwise.
+
+Protocol (JSON line per message):
+client --> daemon: {"hostname", "ssh_user", "ssh_pass", "ssh_key_file", "connect_timeout", "cmd", "timeout", "pty"}
+daemon --> client: {"out": text}, {"err": text} as output arrives,
+                   then {"rc": int, "timed_out": bool} or {"error": message}
+client closing the connection stops the command
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import sys
+import json
+import stat
+import select
+import time
+import socket
+import contextlib
+import argparse
+import threading
+import subprocess
+import socketserver
+
+# PyPi
+import paramiko as pm
+
+# DevOpsiPy
+from . import exceptions as pe
+from . import host_base_const as hbc
+from . import remote_executor as rx
+
+
+def default_socket_path():
+    """
+    :return: socket path from DEVOPSIPY_SSH_MUX env var, per user default OW
+             ($XDG_RUNTIME_DIR if it's set, /tmp/devopsipy-<uid> OW)
+    """
+    if os.environ.get(hbc.SSH_MUX_ENV_VAR):
+        return os.environ[hbc.SSH_MUX_ENV_VAR]
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return hbc.SSH_MUX_RUNTIME_SOCKET.format(runtime_dir=os.environ['XDG_RUNTIME_DIR'])
+    return hbc.SSH_MUX_SOCKET.format(uid=os.getuid())
+
+
+def check_socket_path(socket_path):
+    """
+    Verify nobody else can own or access the socket: its directory has to be a real directory
+    owned by the current user with no group/other permissions, and the socket (if exists) owned by the current user
+
+    :param socket_path: Unix socket path
+    :raises PermissionError: if the socket path is not private to the current user
+    """
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    st = os.lstat(socket_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError('SSH mux directory < {} > must be a directory owned by uid < {} > with mode 0700'
+                              .format(socket_dir, os.getuid()))
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if st.st_uid != os.getuid():
+        raise PermissionError('SSH mux socket < {} > is not owned by uid < {} >'.format(socket_path, os.getuid()))
+
+
+# -------------------------------
+# Client
+
+class MuxClient(object):
+    """
+    Class to execute commands on a host through the SSH mux daemon
+
+    :param socket_path: daemon socket path
+    :param hostname: FQDN or IP
+    :param ssh_user: ssh user
+    :param ssh_pass: ssh password
+    :param ssh_key_file: ssh private key file path
+    :param connect_timeout: SSH connect timeout used by the daemon if it has no session to the host yet
+    """
+
+    def __init__(self, socket_path, hostname, ssh_user=None, ssh_pass=None, ssh_key_file=None, connect_timeout=0):
+        self._socket_path = socket_path
+        self._request = dict(hostname=hostname,
+                             ssh_user=ssh_user,
+                             ssh_pass=ssh_pass,
+                             ssh_key_file=ssh_key_file,
+                             connect_timeout=connect_timeout)
+
+    def is_available(self):
+        """
+        Check the daemon accepts connections
+
+        :return: True if available, False OW
+        """
+        try:
+            self._connect().close()
+            return True
+        except OSError:
+            return False
+
+    def execute(self, p, timeout=0, print_stdout=False, on_output=None, get_pty=False):
+        """
+        Execute pstate command through the daemon and fill pstate results
+
+        :param p: pstate object with cmd set
+        :param timeout: command deadline in seconds (0 - no limit)
+        :param print_stdout: stream output to stdout as it arrives
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives (see exec_command())
+        :param get_pty: run the command with a PTY (see remote_executor.exec_channel())
+        :return: pstate object
+        """
+        start = time.time()
+        try:
+            p.stdout, p.stderr, p.rc, p.timed_out = self.exec_command(p.cmd, timeout=timeout,
+                                                                      print_stdout=print_stdout,
+                                                                      on_output=on_output, get_pty=get_pty)
+            if p.timed_out:
+                log.error('Command < {} > on host < {} > timed out after < {} > sec'
+                          .format(p.cmd, p.hostname, timeout))
+        finally:
+            p.runtime = time.time() - start
+        return p
+
+    def exec_command(self, cmd, timeout=0, print_stdout=False, on_output=None, get_pty=False):
+        """
+        Execute command through the daemon
+
+        :param cmd: command string
+        :param timeout: command deadline in seconds (0 - no limit)
+        :param print_stdout: stream output to stdout as it arrives
+        :param on_output: callable(text, is_stderr) called for every output chunk as it arrives.
+                          returning True stops the command, its RC is None then
+                          (the daemon notices the closed connection and closes the channel)
+        :param get_pty: run the command with a PTY (see remote_executor.exec_channel())
+        :return: (stdout str, stderr str, rc int, timed_out bool)
+        """
+        request = dict(self._request, cmd=cmd, timeout=timeout, pty=get_pty)
+        out, err = list(), list()
+        # closing the connection stops the command, the file has to be closed for the socket to be closed
+        with self._connect() as sock, sock.makefile('rb') as f:
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            for line in f:
+                frame = json.loads(line)
+                if 'out' in frame:
+                    out.append(frame['out'])
+                    if print_stdout:
+                        sys.stdout.write(frame['out'])
+                        sys.stdout.flush()
+                    if on_output is not None and on_output(frame['out'], False):
+                        return ''.join(out), ''.join(err), None, False
+                elif 'err' in frame:
+                    err.append(frame['err'])
+                    if on_output is not None and on_output(frame['err'], True):
+                        return ''.join(out), ''.join(err), None, False
+                elif 'rc' in frame:
+                    return ''.join(out), ''.join(err), frame['rc'], frame['timed_out']
+                else:
+                    raise pe.HostConnectivityError('SSH mux failed to execute on host < {} >: {}'
+                                                   .format(request['hostname'], frame.get('error')))
+        raise pe.HostConnectivityError('SSH mux closed connection executing on host < {} >'
+                                       .format(request['hostname']))
+
+    def _connect(self):
+        # never send credentials to a socket planted by another user
+        check_socket_path(self._socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+# -------------------------------
+# Daemon
+
+class MuxServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Class to represent SSH mux daemon, keeping SSH clients per (hostname, user, key file)
+
+    :param socket_path: Unix socket path, its directory is created with 0700 permissions
+                        (an existing directory has to be owned by the current user with 0700 permissions)
+    :param idle_timeout: close SSH sessions with no running commands for this number of seconds
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, idle_timeout=hbc.SSH_MUX_IDLE_TIMEOUT):
+        self._idle_timeout = idle_timeout
+        self._clients = dict()  # (hostname, user, key file) --> _Session
+        self._lock = threading.Lock()  # guards _clients and _connect_locks
+        self._connect_locks = dict()
+
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), mode=0o700, exist_ok=True)
+        try:
+            check_socket_path(socket_path)
+        except PermissionError as e:
+            raise pe.PyworkException('Refusing to start SSH mux: {}'.format(e))
+        if os.path.exists(socket_path):
+            log.warning('removing stale socket < {} >'.format(socket_path))
+            os.remove(socket_path)
+        super().__init__(socket_path, MuxRequestHandler)
+        os.chmod(socket_path, 0o600)
+        threading.Thread(target=self._reap_idle, name='ssh-mux-reaper', daemon=True).start()
+
+    @contextlib.contextmanager
+    def session(self, request, reconnect=False):
+        """
+        Context manager to use authenticated transport to the request host, connecting if there is no active one.
+        The session is not reaped while it's in use
+
+        :param request: request dict
+        :param reconnect: drop the current session and connect again
+        :return: paramiko.Transport
+        """
+        entry = self._acquire(request, reconnect=reconnect)
+        try:
+            yield entry.client.get_transport()
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for entry in entries:
+            entry.client.close()
+
+    def _acquire(self, request, reconnect=False):
+        key = (request['hostname'], request['ssh_user'], request['ssh_key_file'])
+        with self._lock:
+            connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+        with connect_lock:
+            with self._lock:
+                entry = self._clients.get(key)
+                if entry is not None:
+                    transport = entry.client.get_transport()
+                    if not reconnect and transport is not None and transport.is_active():
+                        entry.in_use += 1
+                        return entry
+                    del self._clients[key]
+            if entry is not None:
+                entry.client.close()
+            log.info('opening SSH session to < {} >'.format(request['hostname']))
+            client = rx.connect(request['hostname'],
+                                ssh_user=request['ssh_user'],
+                                ssh_pass=request['ssh_pass'],
+                                ssh_key_file=request['ssh_key_file'],
+                                timeout=request['connect_timeout'])
+            transport = client.get_transport()
+            if transport is None or not transport.is_authenticated():
+                client.close()
+                raise pe.HostConnectivityError('Unable to connect host < {} >'.format(request['hostname']))
+            entry = _Session(client)
+            entry.in_use += 1
+            with self._lock:
+                self._clients[key] = entry
+            return entry
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(min(self._idle_timeout, hbc.SSH_MUX_REAP_INTERVAL))
+            idle = list()
+            with self._lock:
+                for key, entry in list(self._clients.items()):
+                    if not entry.in_use and time.time() - entry.last_used > self._idle_timeout:
+                        idle.append((key, entry))
+                        del self._clients[key]
+            for key, entry in idle:
+                log.info('closing idle SSH session to < {} >'.format(key[0]))
+                entry.client.close()
+
+
+class _Session(object):
+    """
+    SSH client of the daemon with the number of commands running over it
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.time()
+
+
+class MuxRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Class to handle a single command execution request
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            log.debug('executing command on < {} > --> {}'.format(request['hostname'], request['cmd']))
+            with contextlib.ExitStack() as stack:
+                transport = stack.enter_context(self.server.session(request))
+                try:
+                    chan = transport.open_session()
+                except pm.SSHException as e:
+                    # session may be dropped by the host while idle. the command did not start yet, safe to retry
+                    log.warning('SSH session to < {} > failed: {}. reconnecting...'.format(request['hostname'], e))
+                    stack.close()
+                    transport = stack.enter_context(self.server.session(request, reconnect=True))
+                    chan = transport.open_session()
+                result = rx.exec_channel(chan, request['cmd'], timeout=request['timeout'], get_pty=request.get('pty'),
+                                         on_output=self._on_output, cancelled=self._client_closed)
+            self._send(rc=result[2], timed_out=result[3])
+        except (BrokenPipeError, ConnectionResetError):
+            log.warning('client disconnected')
+        except Exception as e:
+            log.error('request failed: {}'.format(e))
+            try:
+                self._send(error=str(e))
+            except OSError:
+                pass
+
+    def _client_closed(self):
+        """
+        :return: True if the client closed the connection (e.g. wait_for() matched), the command is stopped then
+        """
+        readable = select.select([self.connection], [], [], 0)[0]
+        try:
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _on_output(self, text, is_stderr):
+        self._send(**{'err' if is_stderr else 'out': text})
+
+    def _send(self, **frame):
+        self.wfile.write(json.dumps(frame).encode() + b'\n')
+
+
+def serve(socket_path=None, idle_timeout=hbc.SSH_MUX_IDLE_TIMEOUT):
+    """
+    Run SSH mux daemon in the current process (blocking)
+
+    :param socket_path: Unix socket path (default: default_socket_path())
+    :param idle_timeout: close SSH sessions not used for this number of seconds
+    """
+    socket_path = socket_path or default_socket_path()
+    server = MuxServer(socket_path, idle_timeout=idle_timeout)
+    log.info('SSH mux listening on < {} >'.format(socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def start_daemon(socket_path=None, idle_timeout=hbc.SSH_MUX_IDLE_TIMEOUT, wait=hbc.SSH_MUX_START_TIMEOUT):
+    """
+    Start SSH mux daemon as a detached process, unless it is already running
+
+    :param socket_path: Unix socket path (default: default_socket_path())
+    :param idle_timeout: close SSH sessions not used for this number of seconds
+    :param wait: seconds to wait for the daemon to accept connections
+    :return: socket path
+    """
+    socket_path = socket_path or default_socket_path()
+    probe = MuxClient(socket_path, hostname=None)
+    if probe.is_available():
+        log.debug('SSH mux is already running on < {} >'.format(socket_path))
+        return socket_path
+    log.info('starting SSH mux daemon on < {} >'.format(socket_path))
+    # the package has to be importable by the daemon even if it's not installed
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_parent, os.environ.get('PYTHONPATH')])))
+    subprocess.Popen([sys.executable, '-m', __name__, '--socket', socket_path, '--idle-timeout', str(idle_timeout)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True, env=env)
+    deadline = time.time() + wait
+    while not probe.is_available():
+        if time.time() > deadline:
+            raise pe.PyworkException('SSH mux daemon did not start on < {} >'.format(socket_path))
+        time.sleep(0.05)
+    return socket_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DevOpsiPy shared SSH multiplexing daemon')
+    parser.add_argument('--socket', default=default_socket_path(), help='Unix socket path')
+    parser.add_argument('--idle-timeout', type=int, default=hbc.SSH_MUX_IDLE_TIMEOUT,
+                        help='close SSH sessions not used for this number of seconds')
+    args = parser.parse_args()
+    from . import logger
+    logger.set_logger('SshMux')
+    serve(socket_path=args.socket, idle_timeout=args.idle_timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Module to contain incremental regex matching over streamed command output
+
+Output arrives in chunks split at arbitrary points. Every chunk is appended to the incomplete
+last line of its stream and only the complete lines are searched, each line once,
+so a line split between chunks is still matched as a whole.
+
+Usage:
+matcher = StreamMatcher([r'listening on port (\\d+)', r'FATAL: (.*)'])
+for chunk in chunks:
+    m = matcher.feed(chunk)
+    if m:
+        break
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import re
+
+
+class StreamMatcher(object):
+    """
+    Class to match patterns against output stream(s) as they arrive, line by line.
+    Every line is searched on its own (without its '\\n', '\\r\\n' of PTY output is normalized),
+    so '^' and '$' match at the line start and end and a match never spans lines
+
+    :param patterns: regex string, compiled pattern or list of them
+    :param flags: re flags for regex strings
+    """
+
+    def __init__(self, patterns, flags=0):
+        if isinstance(patterns, (str, re.Pattern)):
+            patterns = [patterns]
+        self.patterns = [re.compile(p, flags) if isinstance(p, str) else p for p in patterns]
+        self.match = None
+        self._pending = dict()  # stream --> incomplete last line
+
+    def feed(self, text, stream=0):
+        """
+        Search complete lines of the next output chunk
+
+        :param text: output chunk
+        :param stream: stream id (e.g. 0 - stdout, 1 - stderr), every stream is line-buffered separately
+        :return: re.Match of the first match, None if not found yet
+        """
+        if self.match is not None:
+            return self.match
+        data = (self._pending.get(stream, '') + text).replace('\r\n', '\n')
+        end = data.rfind('\n') + 1
+        if not end:
+            self._pending[stream] = data
+            return None
+        self._pending[stream] = data[end:]
+        self.match = self._search(data, end)
+        return self.match
+
+    def flush(self):
+        """
+        Search the incomplete last lines, once the output is over
+
+        :return: re.Match of the first match, None if not found
+        """
+        for stream, data in self._pending.items():
+            if self.match is None and data:
+                self.match = self._search(data, len(data))
+        self._pending.clear()
+        return self.match
+
+    def _search(self, data, end):
+        """
+        Search every line of data[:end] on its own, so '^' and '$' match at the line boundaries
+
+        :return: the earliest match of any pattern in the first matching line
+        """
+        start = 0
+        while start < end:
+            nl = data.find('\n', start, end)
+            if nl < 0:
+                nl = end
+            line = data[start:nl]
+            found = None
+            for pattern in self.patterns:
+                m = pattern.search(line)
+                if m is not None and (found is None or m.start() < found.start()):
+                    found = m
+            if found is not None:
+                return found
+            start = nl + 1
+        return None
@@ -0,0 +1,262 @@
+"""
+Module to contain in-place text replacement engine for local and remote files
+
+Files are memory-mapped and scanned once for all patterns (literal or regex),
+the result is streamed to a temp file in the same directory and renamed over the original.
+Files without matches are not rewritten.
+
+Usage:
+replace_in_files(['/etc/app/a.conf', '/etc/app/b.conf'], [('old.host', 'new.host'), ('port=80', 'port=8080')])
+replace_in_files(files, [(r'^(\\s*timeout)\\s*=.*$', r'\\1 = 30')], regex=True, flags=re.MULTILINE)
+replace_in_remote_files(host, files, patterns)  # same work in one HostBase.run() round trip
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import re
+import json
+import base64
+import shlex
+import inspect
+
+# DevOpsiPy
+from . import exceptions as pe
+
+
+def replace_in_files(files, patterns, regex=False, flags=0):
+    """
+    Replace patterns in local files in one pass per file
+
+    :param files: file path or list of file paths
+    :param patterns: list of (old, new) pairs or dict {old: new}.
+                     with regex=True old is a regex and new may contain group references (\\1, \\g<name>).
+                     backreferences inside patterns are supported only for a single regex pattern,
+                     inline flags ((?i)old) apply to their own pattern only
+    :param regex: treat patterns as regular expressions, literal strings OW
+    :param flags: re flags for regex patterns
+    :return: dict of file path --> number of replacements
+    :raises PyworkException: invalid pattern or template, file read or write failure
+    """
+    files, patterns = _normalize(files, patterns, regex, flags)
+    log.debug('Replacing < {} > patterns in < {} > files'.format(len(patterns), len(files)))
+    try:
+        return _rewrite_files(files, patterns, regex, flags)
+    except (OSError, ValueError) as e:
+        raise pe.PyworkException('Failed to replace patterns in files: {}'.format(e))
+
+
+def replace_in_remote_files(host, files, patterns, regex=False, flags=0, timeout=0):
+    """
+    Replace patterns in files on a host in one HostBase.run() round trip (the host needs python3)
+
+    :param host: HostBase object
+    :param files: file path or list of file paths on the host
+    :param patterns: list of (old, new) pairs or dict {old: new}
+    :param regex: treat patterns as regular expressions, literal strings OW
+    :param flags: re flags for regex patterns
+    :param timeout: command timeout in seconds (0 - no limit)
+    :return: dict of file path --> number of replacements
+    """
+    files, patterns = _normalize(files, patterns, regex, flags)
+    log.debug('Replacing < {} > patterns in < {} > files on host < {} >'.format(len(patterns), len(files), host))
+    p = host.run(remote_command(files, patterns, regex=regex, flags=flags), timeout=timeout)[0]
+    stdout = p.stdout if isinstance(p.stdout, str) else '\n'.join(p.stdout)
+    if p.rc:
+        raise pe.HostCommandExecutionError('Failed to replace patterns in files on host < {} >: {}'
+                                           .format(host, p.stderr), errors=p)
+    return json.loads(stdout)
+
+
+def remote_command(files, patterns, regex=False, flags=0):
+    """
+    Build self-contained python3 command running the replacement engine
+
+    :return: command string, prints JSON dict of file path --> number of replacements
+    """
+    spec = base64.b64encode(json.dumps([files, patterns, regex, flags]).encode()).decode()
+    script = '\n'.join([
+        inspect.getsource(_copy),
+        inspect.getsource(_compile),
+        inspect.getsource(_rewrite_files),
+        'import sys, json, base64',
+        'print(json.dumps(_rewrite_files(*json.loads(base64.b64decode(sys.argv[1])))))',
+    ])
+    return 'python3 -c {} {}'.format(shlex.quote(script), spec)
+
+
+def _normalize(files, patterns, regex=False, flags=0):
+    """
+    Normalize files and patterns lists, validating patterns and templates before any file is touched
+
+    :raises PyworkException: invalid pattern or template
+    """
+    if isinstance(files, str):
+        files = [files]
+    if isinstance(patterns, dict):
+        patterns = patterns.items()
+    patterns = [[old, new] for old, new in patterns]
+    try:
+        _compile(patterns, regex, flags)
+    except (re.error, IndexError) as e:
+        raise pe.PyworkException('Invalid replacement pattern: {}'.format(e))
+    return list(files), patterns
+
+
+# -------------------------------
+# Engine
+# Has to stay self-contained (no module level names except _copy and _compile), as its source is shipped to remote hosts
+
+def _compile(patterns, regex=False, flags=0):
+    """
+    Compile patterns into a single regex and its replacement function
+
+    :return: (combined regex or None if there is nothing to replace, replacement(match) function, by_line)
+    :raises re.error: invalid pattern or template (bad escape, reference to a missing group)
+    """
+    import re
+
+    if regex:
+        subs = [re.compile(old.encode('UTF-8'), flags) for old, _ in patterns]
+        if len(subs) == 1:
+            combined, offsets = subs[0], [0]
+        else:
+            # every pattern is wrapped by a named group, its own groups are shifted by the group index.
+            # inline global flags ((?i)foo) must start the whole expression, so they are applied to their pattern only
+            parts = list()
+            for i, sub in enumerate(subs):
+                pattern, inline = sub.pattern, b''
+                m = re.match(br'\(\?([aiLmsux]+)\)', pattern)
+                while m:
+                    inline += m.group(1)
+                    pattern = pattern[m.end():]
+                    m = re.match(br'\(\?([aiLmsux]+)\)', pattern)
+                if sub.flags & re.VERBOSE:
+                    # new line ends a trailing comment, which would hide the closing parenthesis
+                    pattern += b'\n'
+                if inline:
+                    pattern = b'(?%s:%s)' % (inline, pattern)
+                parts.append(b'(?P<_p%d>%s)' % (i, pattern))
+            combined = re.compile(b'|'.join(parts), flags)
+            offsets = [combined.groupindex['_p%d' % i] for i in range(len(subs))]
+        # parse templates once (Match.expand() re-parses on every call) into
+        # [literal, group index, literal, group index, ..., literal] with combined pattern group indexes
+        empty = re.match(b'', b'')
+        templates = dict()
+        for i, (_, new) in enumerate(patterns):
+            template, literal, pos = list(), b'', 0
+            new = new.encode('UTF-8')
+            for esc in re.finditer(br'\\(?:g<(\w+)>|([1-9][0-9]?)|.)', new, re.DOTALL):
+                literal += new[pos:esc.start()]
+                pos = esc.end()
+                ref = esc.group(1) or esc.group(2)
+                if ref is None:
+                    literal += empty.expand(esc.group())
+                    continue
+                ref = ref.decode()
+                group = int(ref) if ref.isdigit() else subs[i].groupindex.get(ref)
+                if group is None or group > subs[i].groups:
+                    raise re.error('invalid group reference {} in template {!r} of pattern {!r}'
+                                   .format(ref, new.decode('UTF-8'), subs[i].pattern.decode('UTF-8')))
+                template.extend([literal, offsets[i] + group])
+                literal = b''
+            template.append(literal + new[pos:])
+            templates[None if len(subs) == 1 else '_p%d' % i] = template
+
+        def replacement(m):
+            template = templates[m.lastgroup if len(subs) > 1 else None]
+            data = template[0]
+            for j in range(1, len(template), 2):
+                data += (m.group(template[j]) or b'') + template[j + 1]
+            return data
+        return combined, replacement, False
+
+    table = {old.encode('UTF-8'): new.encode('UTF-8') for old, new in patterns if old}
+    if not table:
+        return None, None, False
+    # longer literals first, so they win over their prefixes
+    combined = re.compile(b'|'.join(re.escape(old) for old in sorted(table, key=len, reverse=True)))
+
+    def replacement(m):
+        return table[m.group()]
+    # literals can't span lines, so the file can be rewritten by line aligned windows in C (re.subn)
+    return combined, replacement, not any(b'\n' in old for old in table)
+
+
+def _copy(buf, out, start, end, chunk_size=1048576):
+    """
+    Copy buf[start:end] to out in chunks
+    """
+    while start < end:
+        out.write(buf[start:min(end, start + chunk_size)])
+        start += chunk_size
+
+
+def _rewrite_files(files, patterns, regex=False, flags=0, window_size=4194304):
+    """
+    Replace all patterns in every file in one pass, writing through temp file and rename
+
+    :return: dict of file path --> number of replacements
+    """
+    import os
+    import mmap
+    import shutil
+    import tempfile
+
+    combined, replacement, by_line = _compile(patterns, regex, flags)
+    if combined is None:
+        return {path: 0 for path in files}
+
+    counts = dict()
+    for path in files:
+        real_path = os.path.realpath(path)
+        counts[path] = 0
+        with open(real_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if not st.st_size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                m = combined.search(buf)
+                if m is None:
+                    continue
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(real_path),
+                                           prefix='.{}.'.format(os.path.basename(real_path)))
+                try:
+                    with os.fdopen(fd, 'wb') as out:
+                        if by_line:
+                            pos = buf.rfind(b'\n', 0, m.start()) + 1
+                            _copy(buf, out, 0, pos)
+                            while pos < len(buf):
+                                end = buf.find(b'\n', min(pos + window_size, len(buf)))
+                                end = len(buf) if end == -1 else end + 1
+                                data, n = combined.subn(replacement, buf[pos:end])
+                                out.write(data)
+                                counts[path] += n
+                                pos = end
+                        else:
+                            pos, n, write = 0, 0, out.write
+                            for m in combined.finditer(buf, m.start()):
+                                start, end = m.span()
+                                if start - pos > window_size:
+                                    _copy(buf, out, pos, start)
+                                else:
+                                    write(buf[pos:start])
+                                write(replacement(m))
+                                pos = end
+                                n += 1
+                            _copy(buf, out, pos, len(buf))
+                            counts[path] = n
+                    shutil.copystat(real_path, tmp)
+                    if hasattr(os, 'chown'):
+                        try:
+                            os.chown(tmp, st.st_uid, st.st_gid)
+                        except PermissionError:
+                            pass
+                    os.replace(tmp, real_path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+    return counts
@@ -0,0 +1,211 @@
+"""
+Module to contain execution tracing with Chrome Trace Event format export
+
+HostBase records spans (resolve, ping, connect, exec, read, close, log) per host and per command,
+with process and thread ids, into a Tracer. The exported JSON file opens in chrome://tracing
+or https://ui.perfetto.dev as a timeline of the whole run.
+Tracing is off by default, the null tracer records nothing.
+
+Usage:
+tracer = tracing.enable()  # before hosts are created, to record their resolve and ping
+hosts = [HostBase(h, ssh_user='user', ssh_key_file='~/.ssh/id_rsa') for h in host_names]
+fleet.run_fleet(hosts, 'uname -r')
+tracer.export('/tmp/run.trace.json')
+"""
+
+__author__ = 'sergey kharnam'
+
+import logging
+log = logging.getLogger(__name__)
+
+# stdlib
+import os
+import json
+import time
+import threading
+
+
+class Span(object):
+    """
+    Class to represent a span being recorded, used as context manager.
+    args can be extended inside the span (e.g. with the command RC)
+    """
+    __slots__ = ('_tracer', 'name', 'cat', 'args', '_start')
+
+    def __init__(self, tracer, name, cat, args):
+        self._tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time_ns() // 1000
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.args['error'] = repr(exc_val)
+        self._tracer.add_event(dict(name=self.name, cat=self.cat, ph='X', ts=self._start,
+                                    dur=time.time_ns() // 1000 - self._start, args=self.args))
+        return False
+
+
+class Tracer(object):
+    """
+    Class to collect trace events (thread safe)
+    """
+    enabled = True
+
+    def __init__(self):
+        self._events = list()
+        self._threads = set()  # (pid, tid) with name metadata recorded
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._events)
+
+    def span(self, name, cat='host', **args):
+        """
+        Record duration of the with block
+
+        :param name: span name, e.g. 'connect'
+        :param cat: category, e.g. 'host', 'command'
+        :param args: values shown with the span (host, cmd...)
+        :return: Span context manager
+        """
+        return Span(self, name, cat, args)
+
+    def instant(self, name, cat='host', **args):
+        """
+        Record instant event
+        """
+        self.add_event(dict(name=name, cat=cat, ph='i', s='t', ts=time.time_ns() // 1000, args=args))
+
+    def add_event(self, event):
+        """
+        Add event of the current process and thread
+
+        :param event: Chrome trace event dict without pid and tid
+        """
+        thread = threading.current_thread()
+        event['pid'], event['tid'] = os.getpid(), thread.ident
+        with self._lock:
+            if (event['pid'], event['tid']) not in self._threads:
+                self._threads.add((event['pid'], event['tid']))
+                self._events.append(dict(name='thread_name', ph='M', pid=event['pid'], tid=event['tid'],
+                                         args=dict(name=thread.name)))
+            self._events.append(event)
+
+    def add_events(self, events):
+        """
+        Add events recorded elsewhere (e.g. by worker processes)
+
+        :param events: list of Chrome trace event dicts
+        """
+        with self._lock:
+            self._events.extend(events)
+
+    def events(self):
+        """
+        :return: copy of recorded events list
+        """
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._threads.clear()
+
+    def export(self, path):
+        """
+        Write events in Chrome Trace Event JSON format
+
+        :param path: output file path
+        :return: path
+        """
+        events = self.events()
+        pids = sorted(set(e['pid'] for e in events))
+        events.extend(dict(name='process_name', ph='M', pid=pid, args=dict(name='devopsipy-{}'.format(pid)))
+                      for pid in pids)
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+        log.info('exported < {} > trace events to < {} >'.format(len(events), path))
+        return path
+
+
+class NullSpan(object):
+    """
+    Class to represent span of disabled tracing, records nothing
+    """
+    __slots__ = ('args',)
+
+    def __init__(self):
+        self.args = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class NullTracer(object):
+    """
+    Class to represent disabled tracing with the Tracer interface
+    """
+    enabled = False
+    _span = NullSpan()
+
+    def __len__(self):
+        return 0
+
+    def span(self, name, cat='host', **args):
+        return self._span
+
+    def instant(self, name, cat='host', **args):
+        pass
+
+    def add_event(self, event):
+        pass
+
+    def add_events(self, events):
+        pass
+
+    def events(self):
+        return list()
+
+    def clear(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
+_tracer = NULL_TRACER
+
+
+def get_tracer():
+    """
+    :return: global tracer, used by hosts not given their own (NULL_TRACER unless enabled)
+    """
+    return _tracer
+
+
+def set_tracer(tracer):
+    """
+    Set global tracer
+
+    :param tracer: Tracer object, None to disable tracing
+    """
+    global _tracer
+    _tracer = tracer if tracer is not None else NULL_TRACER
+
+
+def enable():
+    """
+    Enable tracing with a new global Tracer
+
+    :return: Tracer object
+    """
+    set_tracer(Tracer())
+    return _tracer
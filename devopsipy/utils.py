@@ -6,12 +6,13 @@ import yaml
 __author__ = 'sergey kharnam'
 
 import os
-import inspect
 import pickle
 import random
 import string
 from pathlib import Path
-import exceptions as pe
+from . import exceptions as pe
+from . import callsite
+from . import text_replace
 
 import logging
 log = logging.getLogger(__name__)
@@ -109,10 +110,10 @@ def get_caller():
     Function to return the name of the class and the method the function was invoked from
     :return: class and method names
     """
-    stack = inspect.stack()
-    class_ = stack[1][0].f_locals["self"].__class__
-    method_ = stack[1][0].f_code.co_name
-    return '{}.{}()'.format(str(class_), method_)
+    site = callsite.get_callsite(depth=1)
+    if site is None:
+        return 'unknown()'
+    return '{}.{}()'.format(site.cls, site.func) if site.cls else '{}()'.format(site.func)
 
 
 def get_random_string(length=6):
@@ -137,7 +138,7 @@ def set_env_vars(**varibs):
 
 
 def replace_string_in_file(file_name, old_str, new_str):
-    """Replaces old_str in new_str using sed.
+    """Replaces all occurrences of old_str with new_str in file (in place).
 
     :param file_name: File name including path
     :type file_name: str
@@ -145,8 +146,7 @@ def replace_string_in_file(file_name, old_str, new_str):
     :type old_str: str
     :param new_str: New string
     :type new_str: str
-    :return None
+    :return: number of replacements
     """
     log.debug('Replacing str "{0}" with str "{1}" in file "{2}"'.format(old_str, new_str, file_name))
-    cmd = 'sed "s/{0}/{1}/g" {2} > {2}.temp && mv {2}.temp {2}'.format(old_str, new_str, file_name)
-    # run(cmd, verify_rc=True)
+    return text_replace.replace_in_files(file_name, [(old_str, new_str)])[file_name]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+from devopsipy import aggregator
+
+
+def test_identical_outputs_are_grouped(make_pstate):
+    agg = aggregator.OutputAggregator()
+    agg.add_all([make_pstate(hostname='web1', stdout='5.4\n', stderr=''),
+                 make_pstate(hostname='web2', stdout=['5.4'], stderr=[]),
+                 make_pstate(hostname='web3', stdout='5.10\n', stderr='')])
+    groups = agg.groups()
+    assert len(agg) == 2
+    assert [v.hosts for v in groups] == [['web1', 'web2'], ['web3']]
+
+
+def test_rc_and_stderr_are_part_of_the_output(make_pstate):
+    results = [make_pstate(hostname='web1', stdout='x\n', stderr=''),
+               make_pstate(hostname='web2', stdout='x\n', stderr='', rc=1),
+               make_pstate(hostname='web3', stdout='x\n', stderr='warn\n')]
+    agg = aggregator.OutputAggregator()
+    agg.add_all(results)
+    assert len(agg) == 3
+    agg = aggregator.OutputAggregator(include_rc=False, include_stderr=False)
+    agg.add_all(results)
+    assert len(agg) == 1
+
+
+def test_duplicates_share_the_first_copy(make_pstate):
+    agg = aggregator.OutputAggregator()
+    p1, p2 = make_pstate(hostname='web1', stdout='x\n'), make_pstate(hostname='web2', stdout='x\n')
+    agg.add_all([p1, p2])
+    assert p2.stdout is p1.stdout
+
+
+def test_report_header(make_pstate):
+    agg = aggregator.OutputAggregator()
+    agg.add_all([make_pstate(hostname='web{}'.format(i), stdout='5.4\n') for i in range(1, 4)])
+    assert agg.report().splitlines()[1] == 'web[1-3] (3)'
+
+
+def test_compress_and_expand_hostnames():
+    hosts = ['db', 'web1', 'web2', 'web3', 'web07']
+    assert aggregator.compress_hostnames(hosts) == 'db,web07,web[1-3]'
+    assert aggregator.expand_hostnames('db,web[1-3,07]') == hosts
+    assert aggregator.expand_hostnames(['rack[1-2]-n[1-2]']) == ['rack1-n1', 'rack1-n2', 'rack2-n1', 'rack2-n2']
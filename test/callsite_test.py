@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+from devopsipy import callsite, host_base, utils
+
+STEP_SOURCE = '''
+def {}_step(get_site):
+    return get_site()
+'''
+
+
+class Step(object):
+    def run(self):
+        return callsite.get_callsite()
+
+    def describe(self):
+        return utils.get_caller()
+
+
+def _describe():
+    return utils.get_caller()
+
+
+def _step_of_module(module):
+    name = module.replace('.', '_')
+    namespace = {'__name__': module}
+    exec(compile(STEP_SOURCE.format(name), '/srv/automation/{}.py'.format(name), 'exec'), namespace)
+    return namespace[name + '_step']
+
+
+def test_get_callsite():
+    site = callsite.get_callsite()
+    assert (site.cls, site.func, site.filename) == (None, 'test_get_callsite', __file__)
+    assert str(site) == 'test_get_callsite() {}:{}'.format(__file__, site.lineno)
+    site = Step().run()
+    assert (site.cls, site.func) == ('Step', 'run')
+    assert callsite.get_callsite(depth=1000) is None
+
+
+def test_get_external_callsite_skips_package_frames():
+    p = host_base.HostBase('localhost').run('echo ok')[0]
+    assert (p.caller.func, p.caller.filename) == ('test_get_external_callsite_skips_package_frames', __file__)
+
+
+def test_skip_modules_match_whole_module_names():
+    site = _step_of_module('decorators_app')(callsite.get_external_callsite)
+    assert (site.func, site.filename) == ('decorators_app_step', '/srv/automation/decorators_app.py')
+    site = _step_of_module('decorator')(callsite.get_external_callsite)
+    assert site.func == 'test_skip_modules_match_whole_module_names'
+    site = _step_of_module('concurrent.futures.thread')(callsite.get_external_callsite)
+    assert site.func == 'test_skip_modules_match_whole_module_names'
+
+
+def test_get_caller():
+    assert _describe() == '_describe()'
+    assert Step().describe() == 'Step.describe()'
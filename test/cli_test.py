@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from devopsipy import cli, cli_const as cc
+
+
+def test_exit_code():
+    assert cli.exit_code({'web1': 0, 'web2': 0}) == cc.RC_OK
+    assert cli.exit_code({'web1': 0, 'web2': 3}) == cc.RC_FAILED
+    assert cli.exit_code({'web1': 3, 'web2': 7}, max_rc=True) == 7
+    assert cli.exit_code({'web1': 3, 'web2': -1}, max_rc=True) == cc.RC_UNREACHABLE
+    assert cli.exit_code({'web1': None}, max_rc=True) == cc.RC_UNREACHABLE
+
+
+def test_parse_args_requires_hosts_and_command():
+    with pytest.raises(SystemExit):
+        cli.parse_args(['uptime'])
+    with pytest.raises(SystemExit):
+        cli.parse_args(['-w', 'web1'])
+    args = cli.parse_args(['-w', 'web[1-2]', '-F', '8', 'uname', '-r'])
+    assert (args.hosts, args.fanout, args.command) == (['web[1-2]'], 8, ['uname', '-r'])
+
+
+def test_load_hosts(tmp_path, monkeypatch):
+    monkeypatch.setenv(cc.SSH_PASS_ENV_VAR, 'secret')
+    hostfile = tmp_path / 'hosts.txt'
+    hostfile.write_text('db1  # primary\n\nweb[1-3]\n')
+    inventory = tmp_path / 'inventory.yml'
+    inventory.write_text('web:\n  ssh_user: deploy\n  hosts: [web1, web4]\ndb: db2\n')
+    args = cli.parse_args(['-i', str(inventory), '-f', str(hostfile), '-x', 'web2', '-l', 'admin', 'uptime'])
+    hosts = dict(cli.load_hosts(args))
+    assert list(hosts) == ['web1', 'web4', 'db2', 'db1', 'web3']
+    # command line user overrides the inventory
+    assert hosts['web1'] == dict(ssh_user='admin', ssh_pass='secret', ssh_key_file=None)
+
+
+def test_load_inventory_groups(tmp_path):
+    inventory = tmp_path / 'inventory.yml'
+    inventory.write_text('web:\n  ssh_key_file: ~/.ssh/web\n  hosts: web[1-2]\ndb: [db1]\n')
+    hosts = cli.load_inventory(str(inventory), groups=['web'])
+    assert [h for h, _ in hosts] == ['web1', 'web2']
+    assert not hosts[0][1]['ssh_key_file'].startswith('~')
+    with pytest.raises(ValueError):
+        cli.load_inventory(str(inventory), groups=['missing'])
+
+
+def test_main_on_localhost(capsys):
+    assert cli.main(['-w', 'localhost', 'echo hi; exit 3']) == cc.RC_FAILED
+    assert 'localhost: hi' in capsys.readouterr().out
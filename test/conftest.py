@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from devopsipy import pstate
+
+
+@pytest.fixture
+def make_pstate():
+    """
+    Factory of pstate objects of completed commands (rc 0 on host web1 unless given)
+    """
+    def _make(cmd='uname -r', stdout=None, rc=0, hostname='web1', stderr=None):
+        p = pstate.Pstate(rc=rc, hostname=hostname)
+        p.cmd = cmd
+        if stdout is not None:
+            p.stdout = stdout
+        if stderr is not None:
+            p.stderr = stderr
+        return p
+    return _make
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+from devopsipy import fleet
+
+HOSTS = ['localhost', '127.0.0.2', '127.0.0.3']
+
+
+class DyingHost(fleet.HostSpec):
+    def iter_run(self, commands, **run_kwargs):
+        os._exit(3)
+
+
+def test_iter_fleet_streams_all_results():
+    results = list(fleet.iter_fleet([fleet.HostSpec(h) for h in HOSTS], ['echo 1', 'echo 2']))
+    assert sorted((p.hostname, p.cmd) for p in results) == sorted((h, c) for h in HOSTS for c in ('echo 1', 'echo 2'))
+
+
+def test_run_sharded_keeps_commands_order_per_host():
+    commands = ['echo 1', 'echo 2', 'echo 1']
+    results = fleet.run_sharded([fleet.HostSpec(h) for h in HOSTS], commands, processes=2)
+    assert sorted(results) == sorted(HOSTS)
+    for hostname, p_lst in results.items():
+        assert [p.cmd for p in p_lst] == commands
+        assert [p.stdout for p in p_lst] == [['1'], ['2'], ['1']]
+        assert all(p.hostname == hostname and p.rc == 0 for p in p_lst)
+
+
+def test_run_sharded_accepts_hostnames():
+    results = fleet.run_sharded(HOSTS[:2], 'echo ok', processes=2)
+    assert {h: [p.stdout for p in p_lst] for h, p_lst in results.items()} == {h: [['ok']] for h in HOSTS[:2]}
+
+
+def test_worker_dying_reports_its_hosts_failed():
+    results = fleet.run_sharded([fleet.HostSpec('localhost'), DyingHost('127.0.0.2')], 'echo ok', processes=2)
+    assert results['localhost'][0].rc == 0
+    failed = results['127.0.0.2']
+    assert len(failed) == 1
+    assert failed[0].rc == -1 and failed[0].stderr == ['worker process exited unexpectedly']
+
+
+def test_run_sharded_cancel():
+    start = time.time()
+    results = fleet.run_sharded([fleet.HostSpec('localhost')], ['echo 1', 'sleep 10', 'echo 2'], processes=1,
+                                on_result=lambda p: False)
+    assert time.time() - start < 5
+    assert [p.cmd for p in results['localhost']] == ['echo 1']
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import time
+
+import pytest
+
+from devopsipy import host_base, exceptions as pe
+
+
+def test_verify_rc_does_not_rerun_commands(tmp_path):
+    counter = tmp_path / 'count'
+    host = host_base.HostBase(hostname='localhost')
+    start = time.time()
+    with pytest.raises(pe.HostCommandExecutionError):
+        host.run(['echo x >> {}'.format(counter), 'false'], verify_rc=True)
+    assert time.time() - start < 1
+    assert counter.read_text() == 'x\n'
+
+
+def test_run_returns_pstate_per_command():
+    host = host_base.HostBase(hostname='localhost')
+    p_lst = host.run(['echo a', 'exit 3'])
+    assert [p.rc for p in p_lst] == [0, 3]
+    assert p_lst[0].stdout == ['a']
+
+
+def test_parallel_run_keeps_commands_order():
+    host = host_base.HostBase(hostname='localhost')
+    commands = ['echo 1', 'sleep 0.3; echo 2', 'echo 1']
+    p_lst = host.run(commands, parallel=3)
+    assert [p.cmd for p in p_lst] == commands
+    assert [p.stdout for p in p_lst] == [['1'], ['2'], ['1']]
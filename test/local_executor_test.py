@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import time
+
+from devopsipy import local_executor as le, pstate, host_base_const as hbc
+
+
+def _execute(cmd, timeout=0):
+    p = pstate.Pstate(hostname='localhost')
+    p.cmd = cmd
+    return le.execute(p, timeout=timeout)
+
+
+def test_needs_shell():
+    assert not le.needs_shell('ls -l /tmp')
+    assert le.needs_shell('ls | wc -l')
+    assert le.needs_shell('FOO=1 env')
+    assert le.needs_shell('no_such_executable_xyz --help')
+
+
+def test_execute_collects_output_and_rc():
+    p = _execute('echo out; echo err >&2; exit 5')
+    assert (p.stdout, p.stderr, p.rc, p.timed_out) == (['out'], ['err'], 5, False)
+
+
+def test_timeout_kills_command():
+    start = time.time()
+    p = _execute('sleep 5', timeout=0.5)
+    assert time.time() - start < 3
+    assert p.timed_out and p.rc == hbc.RC_TIMEOUT
+
+
+def test_timeout_with_closed_stdio():
+    start = time.time()
+    p = _execute('exec 1>&- 2>&-; sleep 5', timeout=0.5)
+    assert time.time() - start < 3
+    assert p.timed_out and p.rc == hbc.RC_TIMEOUT
+
+
+def test_follow_timeout_with_closed_stdio():
+    start = time.time()
+    assert le.follow('exec 1>&- 2>&-; sleep 5', timeout=0.5)[2:] == (hbc.RC_TIMEOUT, True)
+    assert time.time() - start < 3
+
+
+def test_on_output_stops_command():
+    start = time.time()
+    p = pstate.Pstate()
+    p.cmd = 'echo ready; sleep 5'
+    le.execute(p, on_output=lambda text, is_stderr: 'ready' in text)
+    assert time.time() - start < 3
+    assert p.rc is None and p.stdout == ['ready']
+
+
+def test_executor_runs_concurrently_in_order():
+    executor = le.LocalExecutor(max_workers=4)
+    start = time.time()
+    p_lst = executor.run(['sleep 0.5; echo {}'.format(i) for i in range(4)])
+    assert time.time() - start < 1.5
+    assert [p.stdout for p in p_lst] == [['0'], ['1'], ['2'], ['3']]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from devopsipy import log_index
+
+RECORDS = [
+    '2026-10-19 10:00:00 - deploy - [    INFO] - connecting to web1',
+    '2026-10-19 10:00:01 - deploy - [   ERROR] - web10 failed',
+    '2026-10-19 10:00:02 - deploy.web - [   ERROR] - web1: restart failed',
+    '2026-10-19 10:00:03 - deploy - [ WARNING] - web1.example.com is slow',
+]
+
+
+def _write_log(path, records):
+    with open(str(path), 'a') as f:
+        f.write(''.join(r + '\n' for r in records))
+    return log_index.LogIndex(str(path))
+
+
+def test_query_by_level_and_time(tmp_path):
+    index = _write_log(tmp_path / 'run.debug', RECORDS)
+    assert [r.text for r in index.query(level='ERROR')] == RECORDS[1:3]
+    since = log_index.parse_time('2026-10-19 10:00:02')
+    assert [r.text for r in index.query(since=since)] == RECORDS[2:]
+
+
+def test_host_matches_whole_name(tmp_path):
+    index = _write_log(tmp_path / 'run.debug', RECORDS)
+    assert [r.text for r in index.query(host='web1')] == [RECORDS[0], RECORDS[2], RECORDS[3]]
+    assert [r.text for r in index.query(host='web10')] == [RECORDS[1]]
+
+
+def test_logger_filter_checks_the_name(tmp_path, monkeypatch):
+    index = _write_log(tmp_path / 'run.debug', RECORDS)
+    assert [r.logger for r in index.query(logger='deploy.web')] == ['deploy.web']
+    # every logger name collides
+    monkeypatch.setattr(log_index.zlib, 'crc32', lambda data: 1)
+    index = _write_log(tmp_path / 'other.debug', RECORDS)
+    assert [r.text for r in index.query(logger='deploy.web')] == [RECORDS[2]]
+
+
+def test_index_is_extended_incrementally(tmp_path):
+    index = _write_log(tmp_path / 'run.debug', RECORDS[:2])
+    assert index.update() == 2
+    _write_log(tmp_path / 'run.debug', RECORDS[2:])
+    assert index.update() == 4
+    assert len(list(index.query())) == 4
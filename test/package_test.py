@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import subprocess
+
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_modules_are_not_shadowed_by_working_directory(tmp_path):
+    (tmp_path / 'tracing.py').write_text('NULL_TRACER = None\n')
+    (tmp_path / 'utils.py').write_text('')
+    code = "from devopsipy import host_base; print(host_base.HostBase('localhost').run('echo ok')[0].stdout)"
+    env = dict(os.environ, PYTHONPATH=PACKAGE_PARENT)
+    out = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    assert out.strip() == "['ok']"
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+from devopsipy import pstate
+
+
+def test_failed_pstate():
+    p = pstate.failed_pstate('web1', ['make', 'make install'], 'unreachable')
+    assert (p.hostname, p.rc, p.cmd, p.stderr) == ('web1', -1, 'make; make install', ['unreachable'])
+    assert p.epoch
+
+
+def test_tuple_round_trip(make_pstate):
+    p = make_pstate(stdout=['5.4'])
+    q = pstate.Pstate.from_tuple(p.to_tuple())
+    assert (q.hostname, q.cmd, q.rc, q.stdout) == ('web1', 'uname -r', 0, ['5.4'])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import os
+
+import pytest
+
+from devopsipy import remote_executor as rx, host_base_const as hbc
+
+
+class FakeSSHClient(object):
+    instances = list()
+
+    def __init__(self):
+        self.connect_calls = list()
+        FakeSSHClient.instances.append(self)
+
+    def load_system_host_keys(self):
+        pass
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        self.connect_calls.append((hostname, kwargs))
+
+
+class SilentChannel(object):
+    """
+    Channel of a command running silently until the channel is closed
+    """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self.pty = False
+        self.sent = list()
+        self.closed = False
+
+    def fileno(self):
+        return self._read_fd
+
+    def get_pty(self):
+        self.pty = True
+
+    def exec_command(self, cmd):
+        pass
+
+    def recv_ready(self):
+        return False
+
+    def recv_stderr_ready(self):
+        return False
+
+    def exit_status_ready(self):
+        return False
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeSSHClient.instances = list()
+    monkeypatch.setattr(rx.pm, 'SSHClient', FakeSSHClient)
+    return FakeSSHClient
+
+
+def test_connect_with_password_only(fake_client):
+    client = rx.connect('web1', ssh_user='deploy', ssh_pass='secret', timeout=3)
+    assert len(client.connect_calls) == 1
+    hostname, kwargs = client.connect_calls[0]
+    assert hostname == 'web1'
+    assert (kwargs['username'], kwargs['password'], kwargs['timeout']) == ('deploy', 'secret', 3)
+
+
+def test_connect_with_missing_key_file_uses_password(fake_client, tmp_path):
+    client = rx.connect('web1', ssh_user='deploy', ssh_pass='secret', ssh_key_file=str(tmp_path / 'missing'))
+    assert client.connect_calls[0][1]['password'] == 'secret'
+
+
+def test_connect_without_credentials_uses_default_keys(fake_client):
+    client = rx.connect('web1', ssh_user='deploy')
+    assert len(client.connect_calls) == 1
+    assert 'password' not in client.connect_calls[0][1]
+
+
+def test_timeout_without_pty_closes_the_channel():
+    chan = SilentChannel()
+    assert rx.exec_channel(chan, 'sleep 60', timeout=0.2) == ('', '', hbc.RC_TIMEOUT, True)
+    assert not chan.pty and not chan.sent
+    assert chan.closed
+
+
+def test_timeout_with_pty_interrupts_the_command():
+    chan = SilentChannel()
+    assert rx.exec_channel(chan, 'sleep 60', timeout=0.2, get_pty=True)[2:] == (hbc.RC_TIMEOUT, True)
+    assert chan.pty and chan.sent == [hbc.PTY_INTERRUPT]
+    assert chan.closed
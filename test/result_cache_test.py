@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import time
+
+from devopsipy import result_cache, host_base
+
+
+def test_results_are_cached_per_user(make_pstate):
+    cache = result_cache.ResultCache()
+    cache.put(make_pstate('whoami', ['deploy']), user='deploy')
+    assert cache.get('web1', 'whoami', user='root') is None
+    assert cache.get('web1', 'whoami', user='deploy').stdout == ['deploy']
+
+
+def test_cached_copies_are_independent(make_pstate):
+    cache = result_cache.ResultCache()
+    cache.put(make_pstate('nproc', ['8']))
+    p = cache.get('web1', 'nproc')
+    assert p.cached
+    p.stdout.append('garbage')
+    assert cache.get('web1', 'nproc').stdout == ['8']
+
+
+def test_failed_results_are_not_cached(make_pstate):
+    cache = result_cache.ResultCache()
+    assert not cache.put(make_pstate('nproc', [], rc=1))
+    assert cache.get('web1', 'nproc') is None
+
+
+def test_ttl_and_lru_eviction(make_pstate):
+    cache = result_cache.ResultCache(ttl=0.1, max_size=2)
+    for cmd in ('a', 'b', 'c'):
+        cache.put(make_pstate(cmd, [cmd]))
+    assert len(cache) == 2 and cache.get('web1', 'a') is None
+    time.sleep(0.2)
+    assert cache.get('web1', 'b') is None
+
+
+def test_invalidate(make_pstate):
+    cache = result_cache.ResultCache()
+    cache.put(make_pstate('a', ['a']), user='deploy')
+    cache.put(make_pstate('a', ['a']), user='root')
+    cache.put(make_pstate('a', ['a'], hostname='web2'))
+    assert cache.invalidate(hostname='web1', user='root') == 1
+    assert cache.invalidate(cmd='a') == 2
+    assert not len(cache)
+
+
+def test_host_serves_cached_results(tmp_path):
+    counter = tmp_path / 'count'
+    host = host_base.HostBase(hostname='localhost', result_cache=result_cache.ResultCache())
+    cmd = 'echo x >> {0}; cat {0}'.format(counter)
+    assert not host.run(cmd, cache=True)[0].cached
+    p = host.run(cmd, cache=True)[0]
+    assert p.cached and p.stdout == ['x']
+    host.invalidate_cache(cmd)
+    assert host.run(cmd, cache=True)[0].stdout == ['x', 'x']
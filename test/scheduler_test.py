@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import time
+
+import pytest
+
+from devopsipy import aggregator, host_base, scheduler, exceptions as pe
+
+HOSTS = ['localhost', '127.0.0.2', '127.0.0.3', '127.0.0.4', '127.0.0.5']
+
+
+class FailingHost(host_base.HostBase):
+    def iter_run(self, commands, **run_kwargs):
+        return super().iter_run('exit 1', **run_kwargs)
+
+
+class SlowHost(host_base.HostBase):
+    def iter_run(self, commands, **run_kwargs):
+        return super().iter_run(['sleep 1'] + list(commands), **run_kwargs)
+
+
+def _hosts(names=HOSTS):
+    return [host_base.HostBase(h) for h in names]
+
+
+def test_waves_by_size_and_percent():
+    waves = scheduler.WaveScheduler(_hosts(), wave_size=2).waves()
+    assert [[str(h) for h in w] for w in waves] == [HOSTS[:2], HOSTS[2:4], HOSTS[4:]]
+    waves = scheduler.WaveScheduler(_hosts(), wave_percent=50).waves()
+    assert [len(w) for w in waves] == [3, 2]
+    assert [len(w) for w in scheduler.WaveScheduler(_hosts()).waves()] == [5]
+
+
+def test_all_waves_run():
+    sched = scheduler.WaveScheduler(_hosts(), wave_size=2)
+    results = sched.run(['echo ok'])
+    assert sorted(results) == sorted(HOSTS)
+    assert all(p_lst[0].stdout == ['ok'] for p_lst in results.values())
+    assert not sched.failed_hosts and not sched.aborted
+
+
+def test_abort_when_failures_exceed_max_failures():
+    sched = scheduler.WaveScheduler(_hosts(), wave_size=2, max_failures=1)
+    with pytest.raises(pe.HostCommandExecutionError):
+        sched.run(['exit 1'])
+    assert sched.aborted
+    assert sorted(sched.failed_hosts) == sorted(HOSTS[:2])
+    assert sorted(sched.results) == sorted(HOSTS[:2])
+
+
+def test_abort_stops_in_flight_hosts_after_current_command(tmp_path):
+    marker = tmp_path / 'marker'
+    sched = scheduler.WaveScheduler([FailingHost('127.0.0.2'), host_base.HostBase('localhost')])
+    with pytest.raises(pe.HostCommandExecutionError):
+        sched.run(['sleep 0.5', 'touch {}'.format(marker)])
+    assert sched.failed_hosts == ['127.0.0.2']
+    time.sleep(1)
+    assert not marker.exists()
+
+
+def test_wave_timeout_does_not_wait_for_stragglers():
+    hosts = [SlowHost('127.0.0.2'), host_base.HostBase('localhost'), host_base.HostBase('127.0.0.3')]
+    sched = scheduler.WaveScheduler(hosts, wave_size=2, max_failures=1, wave_timeout=0.3)
+    start = time.time()
+    results = sched.run(['echo ok'])
+    assert time.time() - start < 1
+    assert sched.failed_hosts == ['127.0.0.2'] and not sched.aborted
+    assert results['127.0.0.2'][0].stderr == ['wave timeout expired']
+    assert results['localhost'][0].rc == results['127.0.0.3'][0].rc == 0
+
+
+def test_results_feed_the_aggregator():
+    agg = aggregator.OutputAggregator()
+    scheduler.WaveScheduler(_hosts(HOSTS[:3]), wave_size=2, aggregator=agg).run('echo same')
+    assert len(agg) == 1
+    assert sorted(agg.groups()[0].hosts) == sorted(HOSTS[:3])
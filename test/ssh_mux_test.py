@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import threading
+
+import paramiko as pm
+import pytest
+
+from devopsipy import ssh_mux, exceptions as pe
+
+
+class FakeChannel(object):
+    def __init__(self, transport):
+        self._transport = transport
+
+    def exec_command(self, cmd):
+        self._transport.executed.append(cmd)
+        raise pm.SSHException('channel closed')
+
+    def close(self):
+        pass
+
+
+class QuietChannel(FakeChannel):
+    """
+    Channel of a command printing a line, then running silently forever (tail -F of a quiet log)
+    """
+
+    def __init__(self, transport):
+        super().__init__(transport)
+        self._read_fd, self._write_fd = os.pipe()
+        self._output = [b'ready\n']
+        self.closed = False
+        self.eof_received = False
+        transport.channels.append(self)
+
+    def fileno(self):
+        return self._read_fd
+
+    def get_pty(self):
+        pass
+
+    def exec_command(self, cmd):
+        self._transport.executed.append(cmd)
+
+    def recv_ready(self):
+        return bool(self._output)
+
+    def recv(self, size):
+        return self._output.pop()
+
+    def recv_stderr_ready(self):
+        return False
+
+    def exit_status_ready(self):
+        return False
+
+    def send(self, data):
+        pass
+
+    def close(self):
+        self.closed = True
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class FakeTransport(object):
+    def __init__(self, channel_class=FakeChannel):
+        self.executed = list()
+        self.channels = list()
+        self._channel_class = channel_class
+
+    def is_active(self):
+        return True
+
+    def open_session(self):
+        return self._channel_class(self)
+
+
+class FakeClient(object):
+    def __init__(self, channel_class=FakeChannel):
+        self.transport = FakeTransport(channel_class)
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    socket_dir = tmp_path / 'mux'
+    socket_dir.mkdir(mode=0o700)
+    return str(socket_dir / 'ssh_mux.sock')
+
+
+def test_refuses_socket_dir_accessible_by_others(tmp_path):
+    socket_dir = tmp_path / 'mux'
+    socket_dir.mkdir()
+    os.chmod(str(socket_dir), 0o755)
+    socket_path = str(socket_dir / 'ssh_mux.sock')
+    with pytest.raises(PermissionError):
+        ssh_mux.check_socket_path(socket_path)
+    with pytest.raises(pe.PyworkException):
+        ssh_mux.MuxServer(socket_path)
+    assert not ssh_mux.MuxClient(socket_path, 'host1').is_available()
+
+
+def test_default_socket_path_prefers_runtime_dir(monkeypatch):
+    monkeypatch.delenv('DEVOPSIPY_SSH_MUX', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', '/run/user/1000')
+    assert ssh_mux.default_socket_path() == '/run/user/1000/devopsipy/ssh_mux.sock'
+
+
+def test_reaper_keeps_sessions_in_use(socket_path):
+    server = ssh_mux.MuxServer(socket_path, idle_timeout=0.1)
+    try:
+        busy, idle = ssh_mux._Session(FakeClient()), ssh_mux._Session(FakeClient())
+        busy.in_use = 1
+        busy.last_used = idle.last_used = time.time() - 10
+        server._clients.update({('busy', None, None): busy, ('idle', None, None): idle})
+        time.sleep(0.5)
+        assert list(server._clients) == [('busy', None, None)]
+        assert idle.client.closed and not busy.client.closed
+    finally:
+        server.server_close()
+
+
+def test_failed_command_is_not_executed_again(socket_path):
+    server = ssh_mux.MuxServer(socket_path)
+    client = FakeClient()
+    server._clients[('host1', None, None)] = ssh_mux._Session(client)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        mux = ssh_mux.MuxClient(socket_path, 'host1')
+        with pytest.raises(pe.HostConnectivityError):
+            mux.exec_command('echo once')
+        assert client.transport.executed == ['echo once']
+        assert server._clients[('host1', None, None)].in_use == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_disconnect_stops_quiet_command(socket_path):
+    server = ssh_mux.MuxServer(socket_path)
+    client = FakeClient(QuietChannel)
+    session = ssh_mux._Session(client)
+    server._clients[('host1', None, None)] = session
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        mux = ssh_mux.MuxClient(socket_path, 'host1')
+        out = mux.exec_command('tail -F app.log', get_pty=True, on_output=lambda text, is_stderr: 'ready' in text)
+        assert out[:3] == ('ready\n', '', None)
+        deadline = time.time() + 2
+        while not client.transport.channels[0].closed and time.time() < deadline:
+            time.sleep(0.05)
+        assert client.transport.channels[0].closed
+        time.sleep(0.1)
+        assert session.in_use == 0
+    finally:
+        server.shutdown()
+        server.server_close()
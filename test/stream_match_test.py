@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+from devopsipy import stream_match
+
+
+def test_anchors_match_line_boundaries():
+    matcher = stream_match.StreamMatcher(r'^ready (\d+)$')
+    assert matcher.feed('booting\nready 80\n').group(1) == '80'
+
+
+def test_anchors_match_incomplete_last_line_on_flush():
+    matcher = stream_match.StreamMatcher(r'^ready (\d+)$')
+    assert matcher.feed('booting\nready 80') is None
+    assert matcher.flush().group(1) == '80'
+
+
+def test_line_split_between_chunks():
+    matcher = stream_match.StreamMatcher([r'FATAL: (.*)', r'listening on port (\d+)'])
+    assert matcher.feed('start\nlisten') is None
+    assert matcher.feed('ing on port 8080\r\nFATAL: x\n').group(1) == '8080'
+
+
+def test_match_does_not_span_lines():
+    matcher = stream_match.StreamMatcher(r'a.*b')
+    assert matcher.feed('a\nb\n') is None
+
+
+def test_streams_are_buffered_separately():
+    matcher = stream_match.StreamMatcher(r'^error: (\w+)$')
+    assert matcher.feed('error: ', stream=0) is None
+    assert matcher.feed('disk\n', stream=1) is None
+    assert matcher.feed('disk\n', stream=0).group(1) == 'disk'
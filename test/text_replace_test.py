@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import re
+import os
+import subprocess
+
+import pytest
+
+from devopsipy import text_replace, exceptions as pe
+
+
+def _file(tmp_path, text, name='app.conf'):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_literal_patterns_in_one_pass(tmp_path):
+    path = _file(tmp_path, 'host=old.host\nport=80\nbackup=old.host.bak\n')
+    counts = text_replace.replace_in_files(path, [('old.host', 'new.host'), ('port=80', 'port=8080')])
+    assert counts == {path: 3}
+    assert open(path).read() == 'host=new.host\nport=8080\nbackup=new.host.bak\n'
+
+
+def test_longer_literal_wins_over_its_prefix(tmp_path):
+    path = _file(tmp_path, 'abc ab\n')
+    text_replace.replace_in_files(path, {'ab': 'X', 'abc': 'Y'})
+    assert open(path).read() == 'Y X\n'
+
+
+def test_literal_spanning_lines(tmp_path):
+    path = _file(tmp_path, 'a\nb\nc\n')
+    assert text_replace.replace_in_files(path, [('a\nb', 'ab')]) == {path: 1}
+    assert open(path).read() == 'ab\nc\n'
+
+
+def test_regex_patterns_with_group_references(tmp_path):
+    path = _file(tmp_path, '  timeout = 10\nretries=3\n')
+    counts = text_replace.replace_in_files(path, [(r'^(\s*timeout)\s*=.*$', r'\1 = 30'),
+                                                  (r'(?P<key>retries)=\d+', r'\g<key>=5')],
+                                           regex=True, flags=re.MULTILINE)
+    assert counts == {path: 2}
+    assert open(path).read() == '  timeout = 30\nretries=5\n'
+
+
+def test_file_without_matches_is_not_rewritten(tmp_path):
+    path = _file(tmp_path, 'nothing here\n')
+    inode = os.stat(path).st_ino
+    assert text_replace.replace_in_files(path, [('old', 'new')]) == {path: 0}
+    assert os.stat(path).st_ino == inode
+
+
+def test_permissions_are_kept(tmp_path):
+    path = _file(tmp_path, 'old\n')
+    os.chmod(path, 0o640)
+    text_replace.replace_in_files(path, [('old', 'new')])
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(pe.PyworkException):
+        text_replace.replace_in_files(str(tmp_path / 'missing'), [('old', 'new')])
+
+
+def test_remote_command_is_self_contained(tmp_path):
+    path = _file(tmp_path, 'port=80\n')
+    cmd = text_replace.remote_command([path], [['port=80', 'port=8080']])
+    out = subprocess.run(cmd, shell=True, cwd=str(tmp_path), stdout=subprocess.PIPE, check=True).stdout
+    assert out.strip() == '{{"{}": 1}}'.format(path).encode()
+    assert open(path).read() == 'port=8080\n'
+
+
+@pytest.mark.parametrize('patterns', [[(r'(unclosed', 'x')],
+                                      [(r'(a)', r'\2')],
+                                      [(r'(?P<key>a)', r'\g<value>')],
+                                      [(r'(a)', r'\1'), (r'b', r'\1')],
+                                      [(r'a', r'\q')]])
+def test_invalid_patterns_fail_before_files_are_touched(tmp_path, patterns):
+    path = _file(tmp_path, 'a b\n')
+    with pytest.raises(pe.PyworkException):
+        text_replace.replace_in_files([path, str(tmp_path / 'missing')], patterns, regex=True)
+    with pytest.raises(pe.PyworkException):
+        text_replace.replace_in_remote_files(None, [path], patterns, regex=True)
+    assert open(path).read() == 'a b\n'
+
+
+def test_inline_flags_apply_to_their_pattern(tmp_path):
+    path = _file(tmp_path, 'Host=a\nPORT=80\nport=81\n')
+    counts = text_replace.replace_in_files(path, [(r'(?i)^host=(\w+)$', r'host=\1'),
+                                                  (r'^port=(\d+)  # lower case only', r'port=90')],
+                                           regex=True, flags=re.MULTILINE | re.VERBOSE)
+    assert counts == {path: 2}
+    assert open(path).read() == 'host=a\nPORT=80\nport=90\n'
+    path = _file(tmp_path, 'Foo foo BAR bar\n', name='b.conf')
+    assert text_replace.replace_in_files(path, [(r'(?i)foo', 'x'), (r'bar', 'y')], regex=True) == {path: 3}
+    assert open(path).read() == 'x x BAR y\n'
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+import json
+
+import pytest
+
+from devopsipy import host_base, tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.set_tracer(None)
+
+
+def _export(tracer, tmp_path):
+    with open(tracer.export(str(tmp_path / 'run.trace.json'))) as f:
+        return json.load(f)
+
+
+def test_export_of_localhost_run(tracer, tmp_path):
+    host_base.HostBase('localhost').run(['echo a', 'echo b'], print_pstate=True)
+    trace = _export(tracer, tmp_path)
+    assert trace['displayTimeUnit'] == 'ms'
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert [e['name'] for e in spans] == ['resolve'] + ['exec', 'read', 'log'] * 2
+    assert [e['args'].get('cmd') for e in spans if e['name'] == 'read'] == ['echo a', 'echo b']
+    assert all(e['args']['rc'] == 0 for e in spans if e['name'] == 'read')
+    for e in spans:
+        assert e['pid'] == os.getpid()
+        assert isinstance(e['ts'], int) and isinstance(e['dur'], int) and e['dur'] >= 0
+        assert e['args']['host'] == 'localhost'
+    assert spans == sorted(spans, key=lambda e: e['ts'])
+
+    metadata = [e for e in trace['traceEvents'] if e['ph'] == 'M']
+    threads = {e['tid']: e['args']['name'] for e in metadata if e['name'] == 'thread_name'}
+    assert set(threads) == set(e['tid'] for e in spans)
+    assert threads[spans[0]['tid']] == 'MainThread'
+    processes = [e for e in metadata if e['name'] == 'process_name']
+    assert [(e['pid'], e['args']['name']) for e in processes] == [(os.getpid(), 'devopsipy-{}'.format(os.getpid()))]
+
+
+def test_parallel_run_records_worker_threads(tracer, tmp_path):
+    host_base.HostBase('localhost').run(['echo a', 'echo b'], parallel=2)
+    events = _export(tracer, tmp_path)['traceEvents']
+    threads = {e['tid'] for e in events if e['name'] == 'thread_name'}
+    assert {e['tid'] for e in events if e['name'] == 'exec'} <= threads
+    assert len(threads) > 1
+
+
+def test_null_tracer_records_nothing():
+    tracing.set_tracer(None)
+    assert tracing.get_tracer() is tracing.NULL_TRACER
+    host_base.HostBase('localhost').run('echo a')
+    with tracing.NULL_TRACER.span('exec', cmd='echo a'):
+        pass
+    tracing.NULL_TRACER.instant('done')
+    assert len(tracing.NULL_TRACER) == 0
+    assert tracing.NULL_TRACER.events() == []